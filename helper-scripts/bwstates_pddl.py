@@ -0,0 +1,166 @@
+"""
+Translation of bwstates output to PDDL problems of the blocks domain, which
+generate-prob-pddl.py is the command line interface of.
+
+bwstates -n N prints a problem as five lines: the number of blocks, the
+initial state, the number of blocks again, the goal state, and 0, where a
+state lists, for each block 1..N, the block it is on, or 0 for the table.
+"""
+
+import re
+from multiprocessing import Pool
+from os import listdir
+from os.path import isfile, join
+
+FILE_START = "(define"
+FILE_END = ")"
+
+_PROBLEM_FILE = re.compile(r"^test\.[0-9]*$")
+_BLOCKS_WORLD_LINES = [
+    re.compile(r"^\s([0-9]*)$"),
+    re.compile(r"^(\s[0-9]*)+$"),
+    re.compile(r"^\s([0-9]*)$"),
+    re.compile(r"^(\s[0-9]*)+$"),
+    re.compile("0"),
+]
+
+
+def getProbFiles(fileDir: str) -> list[str]:
+    """Returns the names of the bwstates output files (test.N) in fileDir."""
+    allFiles = [f for f in listdir(fileDir) if isfile(join(fileDir, f))]
+    return sorted(f for f in allFiles if _PROBLEM_FILE.match(f))
+
+
+def fileFormatIsInvalid(lines: list[str]) -> bool:
+    if len(lines) != len(_BLOCKS_WORLD_LINES):
+        return True
+
+    return not all(
+        regex.match(line) for regex, line in zip(_BLOCKS_WORLD_LINES, lines)
+    )
+
+
+def parseStates(lines: list[str]) -> tuple[list[int], list[int]]:
+    """
+    Returns the initial and goal states of bwstates output, or raises a
+    ValueError if the lines aren't bwstates output.
+    """
+    if fileFormatIsInvalid(lines):
+        raise ValueError("File definition not correct")
+
+    return ([int(x) for x in lines[1].split()], [int(x) for x in lines[3].split()])
+
+
+def getProblemName(fileName: str) -> str:
+    nameWithDashes = fileName
+    for char in " .()":
+        nameWithDashes = nameWithDashes.replace(char, "-")
+    return f"blocks-{nameWithDashes}"
+
+
+def getStateAtoms(states: list[int]) -> list[list[str]]:
+    """
+    Returns the atoms of a state, as lists of a predicate and its arguments:
+    for each block, the block it is on (or the table) and, if no block is on
+    it, that it is clear; then handempty.
+    """
+    covered = set(states)
+    atoms = []
+
+    for blockNum, onBlock in enumerate(states, 1):
+        if onBlock == 0:
+            atoms.append(["ontable", f"b{blockNum}"])
+        else:
+            atoms.append(["on", f"b{blockNum}", f"b{onBlock}"])
+
+        if blockNum not in covered:
+            atoms.append(["clear", f"b{blockNum}"])
+
+    atoms.append(["handempty"])
+
+    return atoms
+
+
+def getStateElementLines(atoms: list[list[str]]) -> list[str]:
+    return [f"({' '.join(atom)})" for atom in atoms]
+
+
+def atomsToPddl(
+    problemName: str,
+    numBlocks: int,
+    initialAtoms: list[list[str]],
+    goalAtoms: list[list[str]],
+) -> str:
+    """Returns the PDDL problem for the atoms of the initial and goal states."""
+    blocksText = " ".join([f"b{i + 1}" for i in range(numBlocks)])
+    return "".join(
+        [
+            FILE_START,
+            f"(problem {problemName})",
+            "(:domain blocks)",
+            f"(:objects {blocksText})",
+            "(:init",
+            *getStateElementLines(initialAtoms),
+            ")",
+            "(:goal (and",
+            *getStateElementLines(goalAtoms),
+            "))",
+            FILE_END,
+        ]
+    )
+
+
+def statesToPddl(problemName: str, initial: list[int], goal: list[int]) -> str:
+    """Returns the PDDL problem for the initial and goal states."""
+    return atomsToPddl(
+        problemName, len(initial), getStateAtoms(initial), getStateAtoms(goal)
+    )
+
+
+def translateToPddl(probFileName: str, lines: list[str]) -> str:
+    """
+    Returns the PDDL problem for the bwstates output in lines, which was
+    read from the file probFileName (e.g., test.10.1), which names it.
+    """
+    (initial, goal) = parseStates(lines)
+    return statesToPddl(getProblemName(probFileName), initial, goal)
+
+
+def generatePddlFile(fileDir: str, probFile: str) -> str:
+    """
+    Translates the bwstates output in fileDir/probFile to PDDL, writes it to
+    fileDir/probFile.pddl, and returns the name of the PDDL file.
+    """
+    with open(join(fileDir, probFile)) as f:
+        lines = f.readlines()
+
+    pddl = translateToPddl(probFile, lines)
+
+    pddlFile = join(fileDir, probFile) + ".pddl"
+    with open(pddlFile, "w") as f:
+        f.write(pddl)
+    return pddlFile
+
+
+def generatePddlFiles(
+    fileDir: str, probFiles: list[str], processes: int | None = None
+) -> list[str | None]:
+    """
+    Translates each of the bwstates output files in fileDir to PDDL, with a
+    pool of processes (os.cpu_count() of them by default) unless processes
+    is 1. Returns the names of the PDDL files, or None for the files that
+    aren't bwstates output.
+    """
+    jobs = [(fileDir, probFile) for probFile in probFiles]
+    if processes == 1 or len(jobs) < 2:
+        return [_generatePddlFileOrNone(job) for job in jobs]
+
+    with Pool(processes) as pool:
+        return pool.map(_generatePddlFileOrNone, jobs, chunksize=64)
+
+
+def _generatePddlFileOrNone(job: tuple[str, str]) -> str | None:
+    try:
+        return generatePddlFile(*job)
+    except ValueError:
+        return None
@@ -15,6 +15,11 @@ The blocks-world actions use three state variables:
 - pos[b] = block b's position, which may be 'table', 'hand', or another block.
 - clear[b] = False if a block is on b or the hand is holding b, else True.
 - holding['hand'] = name of the block being held, or False if 'hand' is empty.
+
+They also maintain done[b], the methods' cache of whether block b is done (see
+is_done in methods.py). Moving b can only change b's own done-ness, since
+nothing is on top of a block that's being moved, so each action just forgets
+the cached value for the block it moves (if the state has a cache yet).
 """
 
 
@@ -22,11 +27,17 @@ def has(collection: dict, key: str, val) -> bool:
     return key in collection.keys() and collection[key] == val
 
 
+def forget_done(s, b):
+    if hasattr(s, "done"):
+        s.done.pop(b, None)
+
+
 def pickup(s, x):
     if s.pos[x] == "table" and has(s.clear, x, True) and s.holding["hand"] == False:
         s.pos[x] = "hand"
         s.clear[x] = False
         s.holding["hand"] = x
+        forget_done(s, x)
         return s
 
 
@@ -41,6 +52,7 @@ def unstack(s, b1, b2):
         s.clear[b1] = False
         s.holding["hand"] = b1
         s.clear[b2] = True
+        forget_done(s, b1)
         return s
 
 
@@ -49,6 +61,7 @@ def putdown(s, b1):
         s.pos[b1] = "table"
         s.clear[b1] = True
         s.holding["hand"] = False
+        forget_done(s, b1)
         return s
 
 
@@ -58,4 +71,5 @@ def stack(s, b1, b2):
         s.clear[b1] = True
         s.holding["hand"] = False
         s.clear[b2] = False
+        forget_done(s, b1)
         return s
@@ -0,0 +1,163 @@
+"""
+A dedicated planning mode for blocks_htn that runs the Gupta & Nau
+algorithm of m_moveblocks directly, without going through gtpyhop's
+recursive search.
+
+m_moveblocks rebuilds the list of clear blocks and recomputes the status of
+each one every time ("achieve", mgoal) is refined, which is O(n) work per
+move. Here the statuses are computed once and kept in two worklists:
+    - candidates: clear blocks whose status is 'move-to-block' or
+      'move-to-table', i.e., the blocks m_moveblocks' first loop looks for;
+    - waiting: clear blocks whose status is 'waiting' and that aren't on the
+      table, i.e., the blocks m_moveblocks' second loop looks for.
+Moving a block x from src to dest can only change the status of x, src,
+dest, and the blocks whose goal position is one of those three, so only
+those are updated after each move.
+
+m_moveblocks picks the first suitable block in the order of state.clear, so
+each worklist is a heap keyed by that order. This makes the total work
+O(n log n) for n blocks, and the plan is identical to the one find_plan
+returns for [("achieve", mgoal)].
+"""
+
+import heapq
+import time
+
+import gtpyhop
+
+
+def find_plan(state, mgoal):
+    """
+    Returns the plan that gtpyhop.find_plan(state, [("achieve", mgoal)])
+    would return with the blocks_htn methods, or False if the hand isn't
+    empty in the given state. Like gtpyhop.find_plan, it prints the status,
+    the number of nodes expanded (none, since there's no search), the
+    runtime, and the result when gtpyhop.verbose >= 1.
+    """
+    start = time.time()
+    result = _move_blocks(state, mgoal)
+    end = time.time()
+    if gtpyhop.verbose >= 1:
+        print("FP> status =", "no-plan" if result == False else "plan-found")
+        print("FP> nodes expanded =", 0)
+        print("FP> runtime =", end - start)
+        print("FP> result =", result)
+    return result
+
+
+def _move_blocks(state, mgoal):
+    if state.holding.get("hand"):
+        return False
+
+    pos = dict(state.pos)
+    clear = {b: True for b in state.clear if state.clear[b] == True}
+    goal = mgoal.pos
+
+    # blocks that m_moveblocks visits first come first
+    rank = {b: i for i, b in enumerate(state.clear)}
+
+    # goal_above[c] lists the blocks whose goal is to be on block c
+    goal_above = {}
+    for b, c in goal.items():
+        goal_above.setdefault(c, []).append(b)
+
+    done = {}
+    for b in pos:
+        _fill_done(b, pos, goal, done)
+
+    status = {}
+    candidates = []
+    waiting = []
+
+    def update(b):
+        """Recompute b's status and add it to the matching worklist."""
+        if done[b]:
+            new_status = "done"
+        elif not clear.get(b):
+            new_status = "inaccessible"
+        elif goal.get(b, "table") == "table":
+            new_status = "move-to-table"
+        elif done[goal[b]] and clear.get(goal[b]):
+            new_status = "move-to-block"
+        else:
+            new_status = "waiting"
+
+        old_status = status.get(b)
+        status[b] = new_status
+        if new_status == old_status:
+            return
+        if is_candidate(b):
+            heapq.heappush(candidates, (rank[b], b))
+        elif is_waiting(b):
+            heapq.heappush(waiting, (rank[b], b))
+
+    def is_candidate(b):
+        return status[b] in ("move-to-block", "move-to-table")
+
+    def is_waiting(b):
+        return status[b] == "waiting" and pos[b] != "table"
+
+    def first(worklist, belongs):
+        """Drop stale entries, then return the first block on the worklist."""
+        while worklist:
+            b = worklist[0][1]
+            if belongs(b):
+                return b
+            heapq.heappop(worklist)
+        return None
+
+    for b in pos:
+        update(b)
+
+    plan = []
+    while True:
+        x = first(candidates, is_candidate)
+        if x is not None:
+            dest = goal[x] if status[x] == "move-to-block" else "table"
+        else:
+            x = first(waiting, is_waiting)
+            if x is None:
+                return plan
+            dest = "table"
+
+        src = pos[x]
+        if src == "table":
+            plan.append(("pickup", x))
+        else:
+            plan.append(("unstack", x, src))
+        if dest == "table":
+            plan.append(("putdown", x))
+        else:
+            plan.append(("stack", x, dest))
+
+        pos[x] = dest
+        done[x] = (x not in goal or goal[x] == dest) and (
+            dest == "table" or done[dest]
+        )
+        if src != "table":
+            clear[src] = True
+            rank.setdefault(src, len(rank))
+        if dest != "table":
+            clear[dest] = False
+
+        for b in (x, src, dest):
+            if b == "table":
+                continue
+            update(b)
+            for above in goal_above.get(b, []):
+                update(above)
+
+
+def _fill_done(b, pos, goal, done):
+    """Same as blocks_htn.methods.update_done, for a single tower."""
+    tower = []
+    while b not in done:
+        if b in goal and goal[b] != pos[b]:
+            done[b] = False
+        elif pos[b] == "table":
+            done[b] = True
+        else:
+            tower.append(b)
+            b = pos[b]
+    for above in reversed(tower):
+        done[above] = done[b]
@@ -7,18 +7,76 @@ Method definitions for blocks_htn.
 # Helper functions that are used in the methods' preconditions.
 
 
+class DoneCache(dict):
+    """
+    Maps each block to whether it is done (see is_done). The values are
+    plain booleans, so a shallow copy is enough when the state is copied,
+    which keeps the cache from adding to the cost of State.copy.
+    """
+
+    def __deepcopy__(self, memo):
+        return DoneCache(self)
+
+
+def build_done(state, mgoal):
+    """
+    Give the initial state an empty done cache and fill it in for mgoal.
+    States that didn't go through build_done get their cache the first time
+    is_done or update_done is called on them.
+    """
+    state.done = DoneCache()
+    update_done(state, mgoal)
+
+
+def get_done(state):
+    """Return state's done cache, giving the state an empty one if it has none."""
+    if not hasattr(state, "done"):
+        state.done = DoneCache()
+    return state.done
+
+
 def has(collection: dict, key: str, val) -> bool:
     return key in collection.keys() and collection[key] == val
 
 
 def is_done(b1, state, mgoal):
+    """
+    A block is done if it and the blocks below it will never need to be
+    moved. Done-ness is cached in state.done; the actions forget the cached
+    value of the block they move, which is the only block whose done-ness
+    a single action can change.
+    """
     if b1 == "table":
         return True
-    if b1 in mgoal.pos and mgoal.pos[b1] != state.pos[b1]:
-        return False
-    if state.pos[b1] == "table":
-        return True
-    return is_done(state.pos[b1], state, mgoal)
+    done = get_done(state).get(b1)
+    if done is None:
+        update_done(state, mgoal)
+        done = state.done[b1]
+    return done
+
+
+def update_done(state, mgoal):
+    """
+    Fill in state.done for every block whose done-ness isn't cached, in one
+    bottom-up pass: walk down each uncached tower until reaching the table,
+    a cached block, or a misplaced block, then fill in the walked blocks on
+    the way back up.
+    """
+    done = get_done(state)
+    for b1 in state.pos:
+        tower = []
+        b = b1
+        while b not in done:
+            pos = state.pos[b]
+            if (b in mgoal.pos and mgoal.pos[b] != pos) or pos == "hand":
+                done[b] = False
+            elif pos == "table":
+                done[b] = True
+            else:
+                tower.append(b)
+                b = pos
+        for above in reversed(tower):
+            done[above] = done[b]
 
 
 def status(b1, state, mgoal):
@@ -0,0 +1,160 @@
+"""
+Batch sampling of blocks world problems with NumPy, for experiments that need
+thousands of random problems per size, of up to hundreds of blocks, where
+running bwstates (or problem_generators.generateBlocksStates, which is a
+port of it) once per state is the bottleneck.
+
+States are encoded as bwstates encodes them: a state of n blocks is a row of
+n integers, where entry i is the block that block i + 1 is on, or 0 if it is
+on the table. A batch of states is an integer array of shape (batch, n).
+
+Like bwstates, sampleStates picks states uniformly at random, but it uses a
+different procedure, so it doesn't generate the same states as bwstates for
+the same seed. A state of n blocks is a set of k towers, i.e., of k nonempty
+ordered lists of the blocks. There are L(n, k) = C(n - 1, k - 1) * n! / k!
+of them (the Lah numbers), each of which is the result of exactly k! of the
+n! * C(n - 1, k - 1) ways to order the blocks and cut the order into k
+towers. So a uniformly random state is sampled by picking k with probability
+proportional to L(n, k), then a uniformly random order of the blocks, and
+k - 1 uniformly random places to cut it, all of which is done for the whole
+batch at once.
+"""
+
+import math
+
+import numpy as np
+
+import gtpyhop
+
+
+def getTowerCountProbabilities(numBlocks: int) -> np.ndarray:
+    """
+    Returns the probabilities that a uniformly random state of numBlocks
+    blocks has 1, 2, ..., numBlocks towers, computed in log space since the
+    Lah numbers overflow floats at around 150 blocks.
+    """
+    n = numBlocks
+    logCounts = np.array(
+        [
+            math.lgamma(n) - math.lgamma(k) - math.lgamma(n - k + 1)
+            + math.lgamma(n + 1) - math.lgamma(k + 1)
+            for k in range(1, n + 1)
+        ]
+    )
+    probabilities = np.exp(logCounts - logCounts.max())
+    return probabilities / probabilities.sum()
+
+
+def sampleStates(
+    numBlocks: int, batchSize: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Returns batchSize uniformly random states of numBlocks blocks."""
+    n = numBlocks
+    states = np.zeros((batchSize, n), dtype=np.int32)
+    if n == 0 or batchSize == 0:
+        return states
+
+    numTowers = rng.choice(
+        np.arange(1, n + 1), size=batchSize, p=getTowerCountProbabilities(n)
+    )
+
+    # the blocks, from the bottom of the first tower to the top of the last
+    order = rng.random((batchSize, n)).argsort(axis=1).astype(np.int32) + 1
+
+    # the k - 1 places between two blocks that a new tower starts at are the
+    # places whose random keys rank below k - 1
+    ranks = rng.random((batchSize, n - 1)).argsort(axis=1).argsort(axis=1)
+    startsTower = np.ones((batchSize, n), dtype=bool)
+    startsTower[:, 1:] = ranks < (numTowers - 1)[:, None]
+
+    below = np.zeros((batchSize, n), dtype=np.int32)
+    below[:, 1:] = order[:, :-1]
+    below[startsTower] = 0
+    states[np.arange(batchSize)[:, None], order - 1] = below
+    return states
+
+
+def sampleProblems(
+    numBlocks: int, batchSize: int, seed: int | None = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the initial and goal states of batchSize random problems of
+    numBlocks blocks, as two (batchSize, numBlocks) arrays.
+    """
+    rng = np.random.default_rng(seed)
+    return (
+        sampleStates(numBlocks, batchSize, rng),
+        sampleStates(numBlocks, batchSize, rng),
+    )
+
+
+def getClearBlocks(states: np.ndarray) -> np.ndarray:
+    """
+    Returns a (batch, n) boolean array that is True where no block is on
+    block i + 1.
+    """
+    (batchSize, n) = states.shape
+    covered = np.zeros((batchSize, n + 1), dtype=bool)
+    covered[np.arange(batchSize)[:, None], states] = True
+    return ~covered[:, 1:]
+
+
+def getBlockNames(numBlocks: int) -> np.ndarray:
+    return np.array([f"b{i + 1}" for i in range(numBlocks)], dtype=object)
+
+
+def toStates(
+    states: np.ndarray, goal: bool = False
+) -> list[gtpyhop.State | gtpyhop.Multigoal]:
+    """
+    Returns the gtpyhop states (or, if goal, the multigoals) of a batch of
+    states, the same as problem_ingestor.generateBlocksState builds from the
+    atoms of their PDDL problems.
+    """
+    (_, n) = states.shape
+    names = getBlockNames(n)
+    positions = np.where(states == 0, "table", names[states - 1]).tolist()
+    clear = getClearBlocks(states)
+
+    result = []
+    for row, clearRow in zip(positions, clear):
+        state = gtpyhop.Multigoal("state_g") if goal else gtpyhop.State("state_0")
+        state.pos = dict(zip(names, row))
+        state.clear = dict.fromkeys(names[clearRow], True)
+        state.holding = {"hand": False}
+        result.append(state)
+    return result
+
+
+def getStateElements(states: np.ndarray) -> list[str]:
+    """
+    Returns, for each state of a batch, its atoms as PDDL text: for each
+    block, the block it is on (or the table) and whether it is clear, then
+    handempty.
+    """
+    (batchSize, n) = states.shape
+    names = getBlockNames(n)
+    onTable = "(ontable " + names + ")"
+    on = ("(on " + names + " ")[None, :] + names[states - 1] + ")"
+    atoms = np.empty((batchSize, n, 2), dtype=object)
+    atoms[:, :, 0] = np.where(states == 0, onTable[None, :], on)
+    atoms[:, :, 1] = np.where(getClearBlocks(states), ("(clear " + names + ")"), "")
+    return ["".join(row) + "(handempty)" for row in atoms.reshape(batchSize, -1).tolist()]
+
+
+def toPddl(
+    initial: np.ndarray, goal: np.ndarray, problemNames: list[str]
+) -> list[str]:
+    """
+    Returns the PDDL problems for a batch of initial and goal states, in the
+    format generate-prob-pddl.py writes, where problem i is called
+    problemNames[i] (e.g., blocks-test-10-1).
+    """
+    objects = "(:objects " + " ".join(getBlockNames(initial.shape[1])) + ")"
+    return [
+        f"(define(problem {name})(:domain blocks){objects}"
+        f"(:init{init})(:goal (and{goal})))"
+        for name, init, goal in zip(
+            problemNames, getStateElements(initial), getStateElements(goal)
+        )
+    ]
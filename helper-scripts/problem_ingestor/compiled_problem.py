@@ -0,0 +1,301 @@
+#! /usr/bin/env python3.10
+
+"""
+A binary format for parsed problems, so that repeated planner runs over the
+same problem skip parsing its PDDL entirely.
+
+Usage:
+    compiled_problem.py PROBLEM_FILE...
+
+compiles each PROBLEM_FILE (e.g., test.10.1.pddl) to a file with the suffix
+.htnp (test.10.1.htnp) next to it, which problem_ingestor.py accepts in
+place of the PDDL file.
+
+A compiled problem is laid out as:
+    - a 16-byte preamble: the magic bytes b"HTNP", the format version
+      (uint32), and the length of the header (uint64);
+    - the header, a JSON object that holds the interned object and predicate
+      tables and the offset and shape of every array;
+    - the arrays, each 8-byte aligned, in native byte order:
+        - for the init and the goal, the atoms as an int32 array of
+          (predicate, arg, ...) rows, padded with -1, and the values of the
+          numeric fluents among them as a float64 array (NaN for the atoms
+          that aren't fluents);
+        - each two-argument numeric fluent, e.g., slew_time and data in the
+          satellite domain, as a float64 matrix indexed by its first and
+          second arguments, with NaN where the fluent isn't defined.
+
+loadProblem maps the file into memory. The atoms are decoded into the
+predicate lists the state builders consume, and the matrices become
+MatrixView mappings over the mapped file, which are neither copied when
+loading nor when gtpyhop copies a state, since these fluents never change.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+import pddl_parser
+
+MAGIC = b"HTNP"
+VERSION = 1
+SUFFIX = ".htnp"
+
+_PREAMBLE = struct.Struct("=4sIQ")
+
+
+class MatrixView(Mapping):
+    """
+    A read-only {(row, col): value} mapping over a float64 matrix, where NaN
+    marks the pairs that aren't in the mapping. Copies of it are the view
+    itself, so states that are copied while planning all share one matrix.
+    """
+
+    def __init__(
+        self, values: memoryview, rows: list[str], cols: list[str], size: int
+    ) -> None:
+        self.values = values
+        self.rows = rows
+        self.cols = cols
+        self.rowIndex = {name: i for i, name in enumerate(rows)}
+        self.colIndex = {name: i for i, name in enumerate(cols)}
+        self.numCols = len(cols)
+        self.size = size
+
+    def __getitem__(self, key: tuple) -> float:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: tuple, default=None):
+        (row, col) = key
+        i = self.rowIndex.get(row)
+        j = self.colIndex.get(col)
+        if i is None or j is None:
+            return default
+        value = self.values[i * self.numCols + j]
+        return value if value == value else default
+
+    def __iter__(self):
+        index = 0
+        for row in self.rows:
+            for col in self.cols:
+                value = self.values[index]
+                index += 1
+                if value == value:
+                    yield (row, col)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        # a mapped file can't be sent to another process; send the values
+        return (dict, (dict(self.items()),))
+
+
+class CompiledProblem:
+    objects: list[str]
+    initialAtoms: list[pddl_parser.Atom]
+    goalAtoms: list[pddl_parser.Atom]
+    initialMatrices: dict[str, MatrixView]
+    goalMatrices: dict[str, MatrixView]
+
+    def __init__(self) -> None:
+        self.objects = []
+        self.initialAtoms = []
+        self.goalAtoms = []
+        self.initialMatrices = {}
+        self.goalMatrices = {}
+
+
+def isCompiledProblem(problemFile: str) -> bool:
+    with open(problemFile, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def getCompiledFileName(problemFile: str) -> str:
+    return os.path.splitext(problemFile)[0] + SUFFIX
+
+
+def compileProblem(problemFile: str, compiledFile: str | None = None) -> str:
+    """
+    Compiles the PDDL problem in problemFile, and returns the name of the
+    compiled file (by default, problemFile with the suffix .htnp).
+    """
+    if compiledFile is None:
+        compiledFile = getCompiledFileName(problemFile)
+    (objects, initialAtoms, goalAtoms) = pddl_parser.readProblemFile(problemFile)
+
+    objectIndex = {name: i for i, name in enumerate(objects)}
+    predicates = []
+    predicateIndex = {}
+    blocks = []
+    header = {"byteorder": sys.byteorder, "sections": {}}
+
+    def intern(name: str) -> int:
+        if name not in objectIndex:
+            objectIndex[name] = len(objectIndex)
+        return objectIndex[name]
+
+    def addBlock(data: array) -> dict:
+        blocks.append(data)
+        return {"block": len(blocks) - 1, "length": len(data)}
+
+    for section, atoms in (("init", initialAtoms), ("goal", goalAtoms)):
+        rows = []
+        values = array("d")
+        matrices = {}
+        for atom in atoms:
+            isFluent = isinstance(atom, pddl_parser.FluentAtom)
+            if isFluent and len(atom) == 4:
+                matrices.setdefault(atom[0], []).append(atom[1:])
+                continue
+
+            args = atom[1:-1] if isFluent else atom[1:]
+            key = (atom[0], len(args), isFluent)
+            if key not in predicateIndex:
+                predicateIndex[key] = len(predicates)
+                predicates.append(key)
+            rows.append([predicateIndex[key]] + [intern(arg) for arg in args])
+            values.append(float(atom[-1]) if isFluent else float("nan"))
+
+        width = max((len(row) for row in rows), default=1)
+        atomData = array("i")
+        for row in rows:
+            atomData.extend(row + [-1] * (width - len(row)))
+
+        header["sections"][section] = {
+            "width": width,
+            "atoms": addBlock(atomData),
+            "values": addBlock(values),
+            "matrices": {
+                name: _compileMatrix(entries, intern, addBlock)
+                for name, entries in matrices.items()
+            },
+        }
+
+    header["objects"] = list(objectIndex)
+    header["predicates"] = predicates
+
+    # the offsets depend on the header's length, which depends on the
+    # offsets; they only grow, so this stops once the length stays the same
+    offsets = [0] * len(blocks)
+    header["offsets"] = offsets
+    headerBytes = b""
+    while True:
+        offset = _PREAMBLE.size + len(headerBytes)
+        for i, data in enumerate(blocks):
+            offsets[i] = offset
+            offset += len(_pad(data.tobytes()))
+        # JSON allows trailing spaces, not NULs
+        newHeaderBytes = _pad(json.dumps(header).encode(), b" ")
+        (headerLength, headerBytes) = (len(headerBytes), newHeaderBytes)
+        if len(headerBytes) == headerLength:
+            break
+
+    with open(compiledFile, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, VERSION, len(headerBytes)))
+        f.write(headerBytes)
+        for data in blocks:
+            f.write(_pad(data.tobytes()))
+    return compiledFile
+
+
+def loadProblem(compiledFile: str) -> CompiledProblem:
+    with open(compiledFile, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, headerLength) = _PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{compiledFile} is not a version {VERSION} compiled problem")
+    header = json.loads(buffer[_PREAMBLE.size : _PREAMBLE.size + headerLength])
+    if header["byteorder"] != sys.byteorder:
+        raise ValueError(f"{compiledFile} has the wrong byte order")
+
+    view = memoryview(buffer)
+    offsets = header["offsets"]
+
+    def getBlock(block: dict, format: str) -> memoryview:
+        offset = offsets[block["block"]]
+        size = block["length"] * struct.calcsize(format)
+        return view[offset : offset + size].cast(format)
+
+    problem = CompiledProblem()
+    problem.objects = objects = header["objects"]
+    predicates = header["predicates"]
+    for section, atoms, matrices in (
+        ("init", problem.initialAtoms, problem.initialMatrices),
+        ("goal", problem.goalAtoms, problem.goalMatrices),
+    ):
+        sectionHeader = header["sections"][section]
+        width = sectionHeader["width"]
+        rows = getBlock(sectionHeader["atoms"], "i").tolist()
+        values = getBlock(sectionHeader["values"], "d").tolist()
+        for i, value in enumerate(values):
+            row = rows[i * width : (i + 1) * width]
+            (name, arity, isFluent) = predicates[row[0]]
+            atom = [name] + [objects[arg] for arg in row[1 : arity + 1]]
+            if isFluent:
+                atom.append(value)
+            atoms.append(atom)
+
+        for name, matrix in sectionHeader["matrices"].items():
+            matrices[name] = MatrixView(
+                getBlock(matrix["values"], "d"),
+                [objects[i] for i in matrix["rows"]],
+                [objects[i] for i in matrix["cols"]],
+                matrix["size"],
+            )
+    return problem
+
+
+def _compileMatrix(entries: list, intern, addBlock) -> dict:
+    rows = {}
+    cols = {}
+    for (row, col, _) in entries:
+        rows.setdefault(row, len(rows))
+        cols.setdefault(col, len(cols))
+
+    values = array("d", [float("nan")]) * (len(rows) * len(cols))
+    cells = set()
+    for (row, col, value) in entries:
+        cell = rows[row] * len(cols) + cols[col]
+        values[cell] = float(value)
+        cells.add(cell)
+    return {
+        "rows": [intern(row) for row in rows],
+        "cols": [intern(col) for col in cols],
+        "values": addBlock(values),
+        "size": len(cells),
+    }
+
+
+def _pad(data: bytes, fill: bytes = b"\0") -> bytes:
+    return data + fill * (-len(data) % 8)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"ERROR: Incorrect number of arguments: {len(sys.argv)}")
+        return
+
+    for problemFile in sys.argv[1:]:
+        print(f"INFO: compiled {problemFile} to {compileProblem(problemFile)}")
+
+
+if __name__ == "__main__":
+    main()
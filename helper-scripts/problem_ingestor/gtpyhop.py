@@ -17,7 +17,12 @@ of the modules in the Examples directory.
 # from IPython import embed
 # from IPython.terminal.debugger import set_trace
 
-import copy, re, time, sys
+import copy, json, multiprocessing, os, re, time, sys
+
+try:
+    import resource
+except ImportError:  # not available on Windows; find_plan ignores max_memory
+    resource = None
 
 ################################################################################
 # How much information to print while the program is running
@@ -100,7 +105,7 @@ class State:
 
     def state_vars(self):
         """Return a list of all state-variable names in the state"""
-        return [v for v in vars(self) if v != "__name__"]
+        return [v for v in vars(self) if not v.startswith("__")]
 
 
 # Sequence number to use when making copies of multigoals.
@@ -169,7 +174,7 @@ class Multigoal:
 
     def state_vars(self):
         """Return a list of all state-variable names in the multigoal"""
-        return [v for v in vars(self) if v != "__name__"]
+        return [v for v in vars(self) if not v.startswith("__")]
 
 
 ################################################################################
@@ -179,7 +184,9 @@ class Multigoal:
 def _make_repr(object, class_name):
     """Return a string that can be used to reconstruct the object"""
     x = f"{class_name}('{object.__name__}', "
-    x += ", ".join([f"{v}={vars(object)[v]}" for v in vars(object) if v != "__name__"])
+    x += ", ".join(
+        [f"{v}={vars(object)[v]}" for v in vars(object) if not v.startswith("__")]
+    )
     x += ")"
     return x
 
@@ -213,7 +220,7 @@ def _print_object(object, heading=None):
         print(title)
         print(dashes)
         for (varname, val) in vars(object).items():
-            if varname != "__name__":
+            if not varname.startswith("__"):
                 print(f"  - {varname} = {val}")
         print("")
     else:
@@ -270,6 +277,14 @@ class Domain:
         # list of all methods for multigoals
         self._multigoal_method_list = []
 
+        # dictionary that maps a task name to the policy that orders its
+        # methods; see declare_task_method_ordering
+        self._task_method_ordering = {}
+
+        # dictionary that maps each action, task, and unigoal name to the
+        # function seek_plan uses for it; see _compile_dispatch
+        self._dispatch = None
+
     def __str__(self):
         return f"<Domain {self.__name__}>"
 
@@ -423,6 +438,7 @@ def declare_actions(*actions):
     if current_domain == None:
         raise Exception(f"cannot declare actions until a domain has been created.")
     current_domain._action_dict.update({act.__name__: act for act in actions})
+    current_domain._dispatch = None
     return current_domain._action_dict
 
 
@@ -485,6 +501,7 @@ def declare_task_methods(task_name, *methods):
         current_domain._task_method_dict[task_name].extend(new_methods)
     else:
         current_domain._task_method_dict.update({task_name: list(methods)})
+    current_domain._dispatch = None
     return current_domain._task_method_dict
 
 
@@ -527,6 +544,7 @@ def declare_unigoal_methods(state_var_name, *methods):
         old_methods = current_domain._unigoal_method_dict[state_var_name]
         new_methods = [m for m in methods if m not in old_methods]
         current_domain._unigoal_method_dict[state_var_name].extend(new_methods)
+    current_domain._dispatch = None
     return current_domain._unigoal_method_dict
 
 
@@ -556,6 +574,124 @@ def declare_multigoal_methods(*methods):
     return current_domain._multigoal_method_list
 
 
+def declare_task_method_ordering(task_name, policy):
+    """
+    declare_task_method_ordering tells GTPyhop to use 'policy' to decide in
+    which order to try the methods for tasks whose name is 'task_name',
+    instead of the order in which they were declared. 'policy' should be an
+    object with a method
+        policy.order(state, task, methods)
+    that returns the list of methods to try, in order. If it also has a method
+        policy.record(task, method, succeeded)
+    then seek_plan calls it each time it has tried a method, with succeeded
+    True if the search below the method found a plan. MethodPriority,
+    MethodScore, and MethodStatistics (below) are such policies.
+
+    Example:
+        declare_task_method_ordering('travel', MethodPriority({travel_by_foot: 1}))
+    says to try travel_by_foot before the other methods for 'travel' tasks.
+
+    Passing None as the policy goes back to the declaration order.
+    """
+    if current_domain == None:
+        raise Exception(f"cannot declare methods until a domain has been created.")
+    if policy == None:
+        current_domain._task_method_ordering.pop(task_name, None)
+    else:
+        current_domain._task_method_ordering[task_name] = policy
+    return current_domain._task_method_ordering
+
+
+################################################################################
+# Method-ordering policies for declare_task_method_ordering
+
+
+class MethodPriority:
+    """
+    MethodPriority(priorities) is a static ordering: 'priorities' maps methods
+    (or method names) to numbers, and methods are tried from the highest
+    priority to the lowest. Methods that aren't in 'priorities' have priority
+    0, and methods with equal priorities are tried in declaration order.
+    """
+
+    def __init__(self, priorities):
+        self.priorities = {
+            (m if isinstance(m, str) else m.__name__): p for (m, p) in priorities.items()
+        }
+
+    def order(self, state, task, methods):
+        return sorted(methods, key=lambda m: -self.priorities.get(m.__name__, 0))
+
+
+class MethodScore:
+    """
+    MethodScore(score) orders methods by a function score(state, method, *args)
+    that is called with the current state, each method, and the task's
+    arguments. Methods are tried from the highest score to the lowest, and
+    methods with equal scores are tried in declaration order. The function is
+    called once per method each time the task is refined, so it should be
+    cheap.
+    """
+
+    def __init__(self, score):
+        self.score = score
+
+    def order(self, state, task, methods):
+        scores = {m: self.score(state, m, *task[1:]) for m in methods}
+        return sorted(methods, key=lambda m: -scores[m])
+
+
+class MethodStatistics:
+    """
+    MethodStatistics(filename=None) learns from experience: for each task
+    name and method it counts how many times seek_plan tried the method and
+    how many of those times the search below it found a plan, and tries the
+    methods with the highest estimated success rate first. Methods with equal
+    estimates, e.g., ones that have never been tried, are tried in declaration
+    order.
+
+    The counts can be saved to and loaded from a JSON file to carry them over
+    to later runs. If 'filename' is given and the file exists, the counts are
+    loaded from it, and save() with no arguments writes them back to it.
+    The same object can be declared as the policy for several tasks.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        # maps each task name to a dict that maps each method name to a
+        # [successes, tries] pair
+        self.counts = {}
+        if filename != None and os.path.exists(filename):
+            self.load(filename)
+
+    def success_rate(self, task_name, method_name):
+        """The estimated success rate, using Laplace's rule of succession."""
+        counts = self.counts.get(task_name, {}).get(method_name, (0, 0))
+        (successes, tries) = counts
+        return (successes + 1) / (tries + 2)
+
+    def order(self, state, task, methods):
+        rates = {m: self.success_rate(task[0], m.__name__) for m in methods}
+        return sorted(methods, key=lambda m: -rates[m])
+
+    def record(self, task, method, succeeded):
+        task_counts = self.counts.setdefault(task[0], {})
+        counts = task_counts.setdefault(method.__name__, [0, 0])
+        if succeeded:
+            counts[0] += 1
+        counts[1] += 1
+
+    def load(self, filename):
+        with open(filename) as f:
+            self.counts = json.load(f)
+
+    def save(self, filename=None):
+        if filename == None:
+            filename = self.filename
+        with open(filename, "w") as f:
+            json.dump(self.counts, f, indent=2, sort_keys=True)
+
+
 ################################################################################
 # A built-in multigoal method and its helper function.
 
@@ -612,10 +748,14 @@ def _goals_not_achieved(state, multigoal):
         s.loc['c2'] = 'room2', g.loc['c2'] = 'room4'.
     Then _goals_not_achieved(s, g) will return
         {'loc': {'c1': 'room3', 'c2': 'room4'}}
+    If incremental_multigoals is True, it gets the answer from the state's
+    _GoalTracker instead of comparing every goal to the state.
     """
+    if incremental_multigoals:
+        return _goal_tracker(state).goals_not_achieved(state, multigoal)
     unachieved = {}
     for name in vars(multigoal):
-        if name != "__name__":
+        if not name.startswith("__"):
             for arg in vars(multigoal).get(name):
                 val = vars(multigoal).get(name).get(arg)
                 if val != vars(state).get(name).get(arg):
@@ -626,6 +766,201 @@ def _goals_not_achieved(state, multigoal):
     return unachieved
 
 
+################################################################################
+# Keeping track of which goals of a multigoal aren't achieved
+
+
+incremental_multigoals = False
+"""
+If incremental_multigoals is True, _goals_not_achieved (which is used by
+m_split_multigoal and by the verification of multigoal methods) doesn't
+compare every goal of a multigoal to the state each time it's called.
+Instead, the first time it sees a multigoal in a state, it records which of
+the multigoal's goals aren't achieved, and replaces the state variables the
+multigoal mentions by dictionaries that update the record whenever a value
+is written to them. After that, in that state and in the states copied from
+it, _goals_not_achieved takes time proportional to the number of goals that
+aren't achieved.
+
+The record is only kept up to date for changes made through the state
+variables' dictionaries, e.g., s.loc['c1'] = 'room3'. If an action assigns
+a new dictionary to a state variable, the records that use it are rebuilt
+from scratch the next time they're needed. Multigoals must not be modified
+after they've been used.
+"""
+
+
+def _goal_tracker(state):
+    """Return the state's _GoalTracker, creating it if necessary."""
+    tracker = vars(state).get("__goal_tracker__")
+    if tracker == None:
+        tracker = _GoalTracker()
+        vars(state)["__goal_tracker__"] = tracker
+    return tracker
+
+
+class _GoalTracker:
+    """
+    The record that incremental_multigoals keeps in a state. For each
+    multigoal it has seen, it keeps the multigoal's goals as a list of
+    (state_var, arg, desired_val) entries, the names of the state variables
+    they use, and the set of positions in the list of the goals that aren't
+    achieved in the state.
+    """
+
+    def __init__(self):
+        # maps id(multigoal) to (multigoal, entries, unachieved, state_vars)
+        self.goals = {}
+        # maps state_var to {arg: [(id(multigoal), position, desired_val)]};
+        # it's never modified, only replaced, so copies can share it
+        self.watchers = {}
+
+    def __deepcopy__(self, memo):
+        the_copy = _GoalTracker.__new__(_GoalTracker)
+        memo[id(self)] = the_copy
+        the_copy.goals = {
+            key: (multigoal, entries, set(unachieved), state_vars)
+            for (key, (multigoal, entries, unachieved, state_vars)) in self.goals.items()
+        }
+        the_copy.watchers = self.watchers
+        return the_copy
+
+    def changed(self, state_var, arg, val):
+        """Called by a _TrackedDict when state_var[arg] becomes val."""
+        watchers = self.watchers.get(state_var)
+        if watchers:
+            for (key, position, desired_val) in watchers.get(arg, ()):
+                record = self.goals.get(key)
+                if record != None:
+                    if val == desired_val:
+                        record[2].discard(position)
+                    else:
+                        record[2].add(position)
+
+    def goals_not_achieved(self, state, multigoal):
+        """Same as _goals_not_achieved(state, multigoal)."""
+        record = self.goals.get(id(multigoal))
+        if record == None or record[0] is not multigoal or self._replaced(state, record):
+            record = self._add(state, multigoal)
+        (_, entries, unachieved, _) = record
+        goal_dict = {}
+        for position in sorted(unachieved):
+            (state_var, arg, val) = entries[position]
+            goal_dict.setdefault(state_var, {})[arg] = val
+        return goal_dict
+
+    def _replaced(self, state, record):
+        """Return True if a state variable the record uses isn't tracked."""
+        for state_var in record[3]:
+            val = vars(state).get(state_var)
+            if type(val) is not _TrackedDict or val._tracker is not self:
+                return True
+        return False
+
+    def _add(self, state, multigoal):
+        """Compare the multigoal to the state, and start tracking it."""
+        entries = []
+        for state_var in vars(multigoal):
+            if state_var.startswith("__"):
+                continue
+            val = vars(state).get(state_var)
+            if type(val) is not _TrackedDict or val._tracker is not self:
+                vars(state)[state_var] = _TrackedDict(val, self, state_var)
+                # records made before the state variable was replaced are stale
+                self._forget(state_var)
+            for (arg, desired_val) in vars(multigoal)[state_var].items():
+                entries.append((state_var, arg, desired_val))
+        unachieved = {
+            position
+            for (position, (state_var, arg, desired_val)) in enumerate(entries)
+            if vars(state)[state_var].get(arg) != desired_val
+        }
+        state_vars = [v for v in vars(multigoal) if not v.startswith("__")]
+        record = (multigoal, entries, unachieved, state_vars)
+        self.goals[id(multigoal)] = record
+        self._rebuild_watchers()
+        return record
+
+    def _forget(self, state_var):
+        for (key, record) in list(self.goals.items()):
+            if state_var in record[3]:
+                del self.goals[key]
+
+    def _rebuild_watchers(self):
+        watchers = {}
+        for (key, (_, entries, _, _)) in self.goals.items():
+            for (position, (state_var, arg, desired_val)) in enumerate(entries):
+                watchers.setdefault(state_var, {}).setdefault(arg, []).append(
+                    (key, position, desired_val)
+                )
+        self.watchers = watchers
+
+
+class _TrackedDict(dict):
+    """
+    A state variable's dictionary that tells a _GoalTracker about every
+    value that is written to it or deleted from it (a deleted value counts
+    as None, as in _goals_not_achieved).
+    """
+
+    def __init__(self, items, tracker, state_var):
+        dict.__init__(self, items)
+        self._tracker = tracker
+        self._state_var = state_var
+
+    def __setitem__(self, arg, val):
+        dict.__setitem__(self, arg, val)
+        self._tracker.changed(self._state_var, arg, val)
+
+    def __delitem__(self, arg):
+        dict.__delitem__(self, arg)
+        self._tracker.changed(self._state_var, arg, None)
+
+    def pop(self, arg, *default):
+        val = dict.pop(self, arg, *default)
+        self._tracker.changed(self._state_var, arg, None)
+        return val
+
+    def popitem(self):
+        (arg, val) = dict.popitem(self)
+        self._tracker.changed(self._state_var, arg, None)
+        return (arg, val)
+
+    def setdefault(self, arg, default=None):
+        if arg not in self:
+            self[arg] = default
+        return dict.__getitem__(self, arg)
+
+    def update(self, *args, **kwargs):
+        for (arg, val) in dict(*args, **kwargs).items():
+            self[arg] = val
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        args = list(self)
+        dict.clear(self)
+        for arg in args:
+            self._tracker.changed(self._state_var, arg, None)
+
+    def __copy__(self):
+        # a copy isn't the state variable, so it shouldn't notify the tracker
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        the_copy = _TrackedDict.__new__(_TrackedDict)
+        memo[id(self)] = the_copy
+        dict.update(the_copy, copy.deepcopy(dict(self), memo))
+        the_copy._tracker = copy.deepcopy(self._tracker, memo)
+        the_copy._state_var = self._state_var
+        return the_copy
+
+    def __reduce__(self):
+        return (_TrackedDict, (dict(self), self._tracker, self._state_var))
+
+
 ################################################################################
 # Functions to verify whether unigoal_methods achieve the goals they are
 # supposed to achieve.
@@ -634,17 +969,72 @@ def _goals_not_achieved(state, multigoal):
 verify_goals = True
 """
 If verify_goals is True, then whenever the planner uses a method m to refine
-a unigoal or multigoal, it will insert a "verification" task into the
-current partial plan. If verify_goals is False, the planner won't insert any
-verification tasks into the plan.
-
-The purpose of the verification task is to raise an exception if the
-refinement produced by m doesn't achieve the goal or multigoal that it is
-supposed to achieve. The verification task won't insert anything into the
-final plan; it just will verify whether m did what it was supposed to do.
+a unigoal or multigoal, it checks whether m achieved the goal or multigoal
+as soon as the planner has finished the items that m produced, and raises an
+exception if it didn't. If verify_goals is False, the planner doesn't check.
+
+If verify_goals is "batch", the planner only notes which state each check
+applies to as it goes, and runs all of the checks at once when it has found
+a plan. This is cheaper for domains whose methods are trusted, but a method
+that doesn't achieve its goal is only reported if the search finds a plan.
+
+The checks are kept on a stack of post-conditions that seek_plan passes
+along with the todo_list (see _push_check), rather than being inserted into
+the todo_list as verification tasks, so they don't make the todo_list longer
+or cost a recursive call each. _m_verify_g and _m_verify_mg do the checking;
+they are still declared as the methods of the "_verify_g" and "_verify_mg"
+tasks for todo_lists that contain such tasks explicitly.
 """
 
 
+def _push_check(checks, todo_list, check, args):
+    """
+    'checks' is None or a pair (stack, completed) of linked lists made of
+    nested tuples, which seek_plan passes along with the todo_list:
+     - stack holds (todo_length, check, args, rest_of_stack) frames. A frame
+       is pushed when a method refines a goal, with todo_length = the length
+       of the rest of the todo_list after the goal. The items that the
+       method produces are finished when the todo_list gets that short,
+       and then the frame is popped and check(state, *args) is called.
+     - completed holds (state, check, args, rest_of_completed) entries for
+       the checks that verify_goals = "batch" has postponed.
+    Return 'checks' with a frame for check(state, *args) pushed onto stack.
+    """
+    (stack, completed) = (None, None) if checks == None else checks
+    return ((len(todo_list), check, args, stack), completed)
+
+
+def _complete_checks(state, todo_list, checks):
+    """
+    Pop the frames of the checks whose items are finished, now that the
+    todo_list is 'todo_list' and the state is 'state', and run them or
+    postpone them. Return what is left of 'checks'.
+    """
+    (stack, completed) = checks
+    if stack == None or len(todo_list) > stack[0]:
+        return checks
+    while stack != None and len(todo_list) <= stack[0]:
+        (_, check, args, stack) = stack
+        if verify_goals == "batch":
+            completed = (state, check, args, completed)
+        else:
+            check(state, *args)
+    if stack == None and completed == None:
+        return None
+    return (stack, completed)
+
+
+def _run_postponed_checks(checks):
+    """Run the checks that verify_goals = "batch" has postponed, in order."""
+    postponed = []
+    completed = None if checks == None else checks[1]
+    while completed != None:
+        (state, check, args, completed) = completed
+        postponed.append((state, check, args))
+    for (state, check, args) in reversed(postponed):
+        check(state, *args)
+
+
 def _m_verify_g(state, method, state_var, arg, desired_val, depth):
     """
     _m_verify_g is a method that GTPyhop uses to check whether a
@@ -682,13 +1072,24 @@ def _m_verify_mg(state, method, multigoal, depth):
 # Applying actions, commands, and methods
 
 
-def _apply_action_and_continue(state, task1, todo_list, plan, depth):
+def _apply_action_and_continue(state, task1, todo_list, plan, depth, checks=None):
     """
     _apply_action_and_continue is called only when task1's name matches an
     action name. It applies the action by retrieving the action's function
     definition and calling it on the arguments, then calls seek_plan
     recursively on todo_list.
     """
+    newstate = _apply_action(state, task1, depth)
+    if newstate:
+        return seek_plan(newstate, todo_list, plan + [task1], depth + 1, checks)
+    return False
+
+
+def _apply_action(state, task1, depth):
+    """
+    Apply the action task1 to a copy of state, and return the new state, or
+    False if the action isn't applicable.
+    """
     if verbose >= 3:
         print(f"depth {depth} action {task1}: ", end="")
     action = current_domain._action_dict[task1[0]]
@@ -697,13 +1098,13 @@ def _apply_action_and_continue(state, task1, todo_list, plan, depth):
         if verbose >= 3:
             print("applied")
             newstate.display()
-        return seek_plan(newstate, todo_list, plan + [task1], depth + 1)
+        return newstate
     if verbose >= 3:
         print("not applicable")
     return False
 
 
-def _refine_task_and_continue(state, task1, todo_list, plan, depth):
+def _refine_task_and_continue(state, task1, todo_list, plan, depth, checks=None):
     """
     If task1 is in the task-method dictionary, then iterate through the list
     of relevant methods to find one that's applicable, apply it to get
@@ -712,7 +1113,48 @@ def _refine_task_and_continue(state, task1, todo_list, plan, depth):
 
     If the call to seek_plan fails, go on to the next method in the list.
     """
+    policy = current_domain._task_method_ordering.get(task1[0])
+    record = getattr(policy, "record", None)
+    for (method, alternative) in _task_method_alternatives(
+        state, task1, todo_list, plan, depth, checks, record
+    ):
+        result = seek_plan(*alternative)
+        succeeded = result != False and result != None
+        if record != None:
+            record(task1, method, succeeded)
+        if succeeded:
+            return result
+    if verbose >= 3:
+        print(f"depth {depth} could not accomplish task {task1}")
+    return False
+
+
+def _task_alternatives(state, task1, todo_list, plan, depth, checks=None):
+    """
+    Generate the (state, todo_list, plan, depth, checks) arguments of the
+    seek_plan calls that _refine_task_and_continue makes, one per applicable
+    method. Methods are applied lazily, so a method isn't tried until the
+    search below the previous one has failed.
+    """
+    for (_, alternative) in _task_method_alternatives(
+        state, task1, todo_list, plan, depth, checks
+    ):
+        yield alternative
+
+
+def _task_method_alternatives(
+    state, task1, todo_list, plan, depth, checks=None, record=None
+):
+    """
+    Like _task_alternatives, but generate (method, alternative) pairs. The
+    methods are tried in the order given by the task's ordering policy, if
+    it has one; if 'record' is given, it is called to record each method
+    that isn't applicable as a failure.
+    """
     relevant = current_domain._task_method_dict[task1[0]]
+    policy = current_domain._task_method_ordering.get(task1[0])
+    if policy != None:
+        relevant = policy.order(state, task1, relevant)
     if verbose >= 3:
         print(f"depth {depth} task {task1} methods {[m.__name__ for m in relevant]}")
     for method in relevant:
@@ -724,34 +1166,50 @@ def _refine_task_and_continue(state, task1, todo_list, plan, depth):
             if verbose >= 3:
                 print("applicable")
                 print(f"depth {depth} subtasks: {subtasks}")
-            result = seek_plan(state, subtasks + todo_list, plan, depth + 1)
-            if result != False and result != None:
-                return result
+            yield (method, (state, subtasks + todo_list, plan, depth + 1, checks))
         else:
             if verbose >= 3:
                 print(f"not applicable")
-    if verbose >= 3:
-        print(f"depth {depth} could not accomplish task {task1}")
-    return False
+            if record != None:
+                record(task1, method, False)
 
 
-def _refine_unigoal_and_continue(state, goal1, todo_list, plan, depth):
+def _refine_unigoal_and_continue(state, goal1, todo_list, plan, depth, checks=None):
     """
     If goal1 is in the unigoal-method dictionary, then iterate through the
     list of relevant methods to find one that's applicable, apply it to get
     additional todo_list items, and call seek_plan recursively on
-          [the additional items] + [verify_g] + todo_list,
+          [the additional items] + todo_list,
 
-    where [verify_g] verifies whether the method actually achieved goal1.
+    with a check pushed onto 'checks' that verifies whether the method
+    actually achieved goal1 once the additional items are finished.
     If the call to seek_plan fails, go on to the next method in the list.
     """
+    for alternative in _unigoal_alternatives(
+        state, goal1, todo_list, plan, depth, checks
+    ):
+        result = seek_plan(*alternative)
+        if result != False and result != None:
+            return result
+    if verbose >= 3:
+        print(f"depth {depth} could not achieve goal {goal1}")
+    return False
+
+
+def _unigoal_alternatives(state, goal1, todo_list, plan, depth, checks=None):
+    """
+    Generate the (state, todo_list, plan, depth, checks) arguments of the
+    seek_plan calls that _refine_unigoal_and_continue makes: just one if
+    goal1 is already achieved, otherwise one per applicable method.
+    """
     if verbose >= 3:
         print(f"depth {depth} goal {goal1}: ", end="")
     (state_var_name, arg, val) = goal1
     if vars(state).get(state_var_name).get(arg) == val:
         if verbose >= 3:
             print(f"already achieved")
-        return seek_plan(state, todo_list, plan, depth + 1)
+        yield (state, todo_list, plan, depth + 1, checks)
+        return
     relevant = current_domain._unigoal_method_dict[state_var_name]
     if verbose >= 3:
         print(f"methods {[m.__name__ for m in relevant]}")
@@ -765,33 +1223,44 @@ def _refine_unigoal_and_continue(state, goal1, todo_list, plan, depth):
                 print("applicable")
                 print(f"depth {depth} subgoals: {subgoals}")
             if verify_goals:
-                verification = [
-                    ("_verify_g", method.__name__, state_var_name, arg, val, depth)
-                ]
+                args = (method.__name__, state_var_name, arg, val, depth)
+                new_checks = _push_check(checks, todo_list, _m_verify_g, args)
             else:
-                verification = []
-            todo_list = subgoals + verification + todo_list
-            result = seek_plan(state, todo_list, plan, depth + 1)
-            if result != False and result != None:
-                return result
+                new_checks = checks
+            yield (state, subgoals + todo_list, plan, depth + 1, new_checks)
         else:
             if verbose >= 3:
                 print(f"not applicable")
-    if verbose >= 3:
-        print(f"depth {depth} could not achieve goal {goal1}")
-    return False
 
 
-def _refine_multigoal_and_continue(state, goal1, todo_list, plan, depth):
+def _refine_multigoal_and_continue(state, goal1, todo_list, plan, depth, checks=None):
     """
     If goal1 is a multigoal, then iterate through the list of multigoal
     methods to find one that's applicable, apply it to get additional
     todo_list items, and call seek_plan recursively on
-          [the additional items] + [verify_mg] + todo_list,
+          [the additional items] + todo_list,
 
-    where [verify_mg] verifies whether the method actually achieved goal1.
+    with a check pushed onto 'checks' that verifies whether the method
+    actually achieved goal1 once the additional items are finished.
     If the call to seek_plan fails, go on to the next method in the list.
     """
+    for alternative in _multigoal_alternatives(
+        state, goal1, todo_list, plan, depth, checks
+    ):
+        result = seek_plan(*alternative)
+        if result != False and result != None:
+            return result
+    if verbose >= 3:
+        print(f"depth {depth} could not achieve multigoal {goal1}")
+    return False
+
+
+def _multigoal_alternatives(state, goal1, todo_list, plan, depth, checks=None):
+    """
+    Generate the (state, todo_list, plan, depth, checks) arguments of the
+    seek_plan calls that _refine_multigoal_and_continue makes, one per
+    applicable multigoal method.
+    """
     if verbose >= 3:
         print(f"depth {depth} multigoal {goal1}: ", end="")
     relevant = current_domain._multigoal_method_list
@@ -807,43 +1276,67 @@ def _refine_multigoal_and_continue(state, goal1, todo_list, plan, depth):
                 print("applicable")
                 print(f"depth {depth} subgoals: {subgoals}")
             if verify_goals:
-                verification = [("_verify_mg", method.__name__, goal1, depth)]
+                args = (method.__name__, goal1, depth)
+                new_checks = _push_check(checks, todo_list, _m_verify_mg, args)
             else:
-                verification = []
-            todo_list = subgoals + verification + todo_list
-            result = seek_plan(state, todo_list, plan, depth + 1)
-            if result != False and result != None:
-                return result
+                new_checks = checks
+            yield (state, subgoals + todo_list, plan, depth + 1, new_checks)
         else:
             if verbose >= 3:
                 print(f"not applicable")
-    if verbose >= 3:
-        print(f"depth {depth} could not achieve multigoal {goal1}")
-    return False
 
 
 ############################################################
 # The planning algorithm
 
 
-def find_plan(state, todo_list):
+def find_plan(state, todo_list, time_limit=None, max_nodes=None, max_memory=None):
     """
     find_plan tries to find a plan that accomplishes the items in todo_list,
     starting from the given state, using whatever methods and actions you
     declared previously. If successful, it returns the plan. Otherwise it
     returns False. Arguments:
      - 'state' is a state;
-     - 'todo_list' is a list of goals, tasks, and actions.
+     - 'todo_list' is a list of goals, tasks, and actions;
+     - 'time_limit' (optional) is the number of seconds to search for;
+     - 'max_nodes' (optional) is the number of nodes (seek_plan calls) to
+       expand;
+     - 'max_memory' (optional) is a ceiling, in megabytes, on the peak memory
+       use of the process.
+    If the search runs out of any of these, find_plan stops it and returns
+    False. Either way, search_stats tells why the search stopped and how far
+    it got.
     """
+    global _budget, search_stats
     if verbose >= 2:
         todo_string = "[" + ", ".join([_item_to_string(x) for x in todo_list]) + "]"
         print(f"FP> find_plan, verbose={verbose}:")
         print(f"    state = {state.__name__}\n    todo_list = {todo_string}")
     start = time.time()
     sys.setrecursionlimit(5000)
-    result = seek_plan(state, todo_list, [], 0)
+    _get_dispatch()
+    deadline = None if time_limit == None else start + time_limit
+    _budget = _SearchBudget(deadline, max_nodes, max_memory)
+    try:
+        if parallel_workers > 1:
+            result = _seek_plan_in_parallel(state, todo_list)
+        else:
+            result = seek_plan(state, todo_list, [], 0)
+        if result != False and result != None:
+            _budget.stats.status = "plan-found"
+        elif _budget.stats.status == None:
+            _budget.stats.status = "no-plan"
+    except _SearchInterrupted as e:
+        result = False
+        _budget.stats.status = e.status
+    finally:
+        search_stats = _budget.stats
+        _budget = None
     end = time.time()
+    search_stats.runtime = end - start
     if verbose >= 1:
+        print("FP> status =", search_stats.status)
+        print("FP> nodes expanded =", search_stats.nodes)
         print("FP> runtime =", end - start)
         print("FP> result =", result)
     return result
@@ -859,38 +1352,116 @@ def pyhop(state, todo_list):
     return find_plan(state, todo_list)
 
 
-def seek_plan(state, todo_list, plan, depth):
+def seek_plan(state, todo_list, plan, depth, checks=None):
     """
     Workhorse for find_plan. Arguments:
      - state is the current state
      - todo_list is the current list of goals, tasks, and actions
      - plan is the current partial plan
      - depth is the recursion depth, for use in debugging
+     - checks is the stack of goal checks that are pending (see _push_check)
     """
     if verbose >= 2:
         todo_string = "[" + ", ".join([_item_to_string(x) for x in todo_list]) + "]"
         print(f"depth {depth} todo_list " + todo_string)
+    if _budget is not None:
+        _budget.expand(plan, depth)
+    if _anytime is not None and _anytime.prune(state, plan, depth):
+        return False
+    if checks is not None:
+        checks = _complete_checks(state, todo_list, checks)
     if todo_list == []:
         if verbose >= 3:
             print(f"depth {depth} no more tasks or goals, return plan")
+        if verify_goals == "batch":
+            _run_postponed_checks(checks)
+        if _anytime is not None:
+            # record the plan, then backtrack to look for a cheaper one
+            _anytime.record(state, plan)
+            return False
         return plan
     item1 = todo_list[0]
-    ttype = get_type(item1)
-    if ttype in {"Multigoal"}:
-        return _refine_multigoal_and_continue(state, item1, todo_list[1:], plan, depth)
-    elif ttype in {"list", "tuple"}:
-        if item1[0] in current_domain._action_dict:
-            return _apply_action_and_continue(state, item1, todo_list[1:], plan, depth)
-        elif item1[0] in current_domain._task_method_dict:
-            return _refine_task_and_continue(state, item1, todo_list[1:], plan, depth)
-        elif item1[0] in current_domain._unigoal_method_dict:
-            return _refine_unigoal_and_continue(
-                state, item1, todo_list[1:], plan, depth
-            )
-    raise Exception(
-        f"depth {depth}: {item1} isn't an action, task, unigoal, or multigoal\n"
-    )
-    return False
+    handler = None
+    if type(item1) is tuple or type(item1) is list:
+        handler = _get_dispatch().get(item1[0])
+    elif isinstance(item1, Multigoal):
+        handler = _refine_multigoal_and_continue
+    if handler == None:
+        raise Exception(
+            f"depth {depth}: {item1} isn't an action, task, unigoal, or multigoal\n"
+        )
+    result = handler(state, item1, todo_list[1:], plan, depth, checks)
+    if _trace is not None and result != False and result != None:
+        _trace.append((todo_list, len(plan), depth, checks))
+    return result
+
+
+def _get_dispatch():
+    """Return current_domain's dispatch table, compiling it if it's missing."""
+    dispatch = current_domain._dispatch
+    if dispatch is None:
+        dispatch = _compile_dispatch(current_domain)
+    return dispatch
+
+
+def _compile_dispatch(domain):
+    """
+    Build domain._dispatch, which maps each action, task, and unigoal name to
+    the function that seek_plan calls for a todo_list item with that name, so
+    that seek_plan needs one dictionary lookup per item. If a name is used for
+    more than one kind of item, actions take precedence over tasks, and tasks
+    over unigoals. The declare_* functions discard domain._dispatch, and
+    find_plan rebuilds it the next time it's called, so a domain that is used
+    for many searches is only compiled once.
+    """
+    dispatch = {}
+    for name in domain._unigoal_method_dict:
+        dispatch[name] = _refine_unigoal_and_continue
+    for name in domain._task_method_dict:
+        dispatch[name] = _refine_task_and_continue
+    for name in domain._action_dict:
+        dispatch[name] = _apply_action_and_continue
+    domain._dispatch = dispatch
+    return dispatch
+
+
+def _alternatives(state, todo_list, plan, depth, checks=None):
+    """
+    Return an iterable of the (state, todo_list, plan, depth, checks)
+    arguments of the seek_plan calls that seek_plan would make for the first
+    item of todo_list, in the order it would make them. The item is looked
+    up in the same compiled dispatch table as in seek_plan (see
+    _compile_dispatch), so both agree on what kind of item it is.
+    """
+    item1 = todo_list[0]
+    handler = None
+    if type(item1) is tuple or type(item1) is list:
+        handler = _get_dispatch().get(item1[0])
+    elif isinstance(item1, Multigoal):
+        handler = _refine_multigoal_and_continue
+    if handler == None:
+        raise Exception(
+            f"depth {depth}: {item1} isn't an action, task, unigoal, or multigoal\n"
+        )
+    alternatives = _alternatives_by_handler[handler]
+    return alternatives(state, item1, todo_list[1:], plan, depth, checks)
+
+
+def _action_alternatives(state, action, rest, plan, depth, checks):
+    newstate = _apply_action(state, action, depth)
+    if newstate:
+        return [(newstate, rest, plan + [action], depth + 1, checks)]
+    return []
+
+
+# The alternatives function that _alternatives uses for each seek_plan handler
+# that the dispatch table can map an item to.
+_alternatives_by_handler = {
+    _apply_action_and_continue: _action_alternatives,
+    _refine_task_and_continue: _task_alternatives,
+    _refine_unigoal_and_continue: _unigoal_alternatives,
+    _refine_multigoal_and_continue: _multigoal_alternatives,
+}
 
 
 def _item_to_string(item):
@@ -904,11 +1475,332 @@ def _item_to_string(item):
         return str(item)
 
 
+################################################################################
+# Search budgets and statistics
+
+
+class SearchStats:
+    """
+    Statistics about a find_plan or find_plan_anytime call:
+     - status is why the search stopped: "plan-found" or "no-plan" if it
+       finished, or "time-limit", "node-limit", or "memory-limit" if it ran
+       out of its budget;
+     - nodes is the number of nodes (seek_plan calls) it expanded;
+     - max_depth is the greatest depth it reached;
+     - deepest_plan is the longest partial plan it produced, which shows how
+       far it got if it didn't find a plan;
+     - runtime is the number of seconds it took.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.nodes = 0
+        self.max_depth = 0
+        self.deepest_plan = []
+        self.runtime = None
+
+    def __repr__(self):
+        return (
+            f"SearchStats(status={self.status!r}, nodes={self.nodes}, "
+            f"max_depth={self.max_depth}, runtime={self.runtime})"
+        )
+
+
+search_stats = None
+"""The SearchStats of the most recent find_plan or find_plan_anytime call."""
+
+
+memory_check_interval = 64
+"""
+find_plan looks at the clock and counts nodes on every node it expands, but
+only looks at the process's memory use once every memory_check_interval nodes.
+"""
+
+
+class _SearchInterrupted(Exception):
+    """Raised inside seek_plan when the search has run out of its budget."""
+
+    def __init__(self, status):
+        Exception.__init__(self, status)
+        self.status = status
+
+
+class _SearchBudget:
+    """The limits of a find_plan call, and the statistics it has gathered."""
+
+    def __init__(self, deadline, max_nodes, max_memory):
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.max_memory = max_memory
+        self.stats = SearchStats()
+        self.next_memory_check = 0
+
+    def expand(self, plan, depth):
+        """Count a node, or raise _SearchInterrupted if the budget is spent."""
+        stats = self.stats
+        if stats.nodes == self.max_nodes:
+            raise _SearchInterrupted("node-limit")
+        if self.deadline != None and time.time() > self.deadline:
+            raise _SearchInterrupted("time-limit")
+        stats.nodes += 1
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+        if len(plan) > len(stats.deepest_plan):
+            stats.deepest_plan = plan
+        if self.max_memory != None and stats.nodes >= self.next_memory_check:
+            if _peak_memory() > self.max_memory:
+                raise _SearchInterrupted("memory-limit")
+            self.next_memory_check = stats.nodes + memory_check_interval
+
+    def limits(self):
+        """The limits to give a worker process that starts searching now."""
+        max_nodes = self.max_nodes
+        if max_nodes != None:
+            max_nodes = max(max_nodes - self.stats.nodes, 0)
+        return (self.deadline, max_nodes, self.max_memory)
+
+    def merge(self, stats):
+        """Add the statistics that a worker process gathered."""
+        self.stats.nodes += stats.nodes
+        self.stats.max_depth = max(self.stats.max_depth, stats.max_depth)
+        if len(stats.deepest_plan) > len(self.stats.deepest_plan):
+            self.stats.deepest_plan = stats.deepest_plan
+        if self.stats.status == None and stats.status != None:
+            self.stats.status = stats.status
+
+
+def _peak_memory():
+    """The process's peak memory use in megabytes, or 0 if it's unknown."""
+    if resource == None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+# The limits and statistics of the find_plan call in progress, if any
+_budget = None
+
+
+################################################################################
+# Anytime planning
+
+
+def plan_length(state, plan):
+    """The default cost function for find_plan_anytime: the number of actions."""
+    return len(plan)
+
+
+def find_plan_anytime(
+    state,
+    todo_list,
+    cost=plan_length,
+    time_limit=None,
+    on_improvement=None,
+    max_nodes=None,
+    max_memory=None,
+):
+    """
+    find_plan_anytime is like find_plan, except that it doesn't stop at the
+    first plan it finds. It keeps backtracking to look for cheaper plans,
+    pruning every partial plan whose cost is already at least that of the
+    best plan found so far, until it has searched all of the alternatives
+    or time_limit seconds have passed. It returns the cheapest plan found,
+    or False if it didn't find any. Arguments:
+     - 'state' is a state;
+     - 'todo_list' is a list of goals, tasks, and actions;
+     - 'cost' is a function cost(state, plan) that returns the cost of the
+       partial plan 'plan' that produced 'state'. Adding actions to a plan
+       must never decrease its cost, or pruning may discard cheaper plans.
+       The default, plan_length, is the number of actions in the plan;
+     - 'time_limit' (optional) is the number of seconds to search for;
+     - 'on_improvement' (optional) is a function that is called as
+       on_improvement(plan, plan_cost) each time a cheaper plan is found;
+     - 'max_nodes' and 'max_memory' (optional) are as in find_plan.
+    Afterwards, search_stats tells why the search stopped; its status is
+    "plan-found" or "no-plan" only if the search space was exhausted.
+    """
+    global _anytime, _budget, search_stats
+    if verbose >= 2:
+        todo_string = "[" + ", ".join([_item_to_string(x) for x in todo_list]) + "]"
+        print(f"FP> find_plan_anytime, verbose={verbose}, time_limit={time_limit}:")
+        print(f"    state = {state.__name__}\n    todo_list = {todo_string}")
+    start = time.time()
+    sys.setrecursionlimit(5000)
+    _get_dispatch()
+    deadline = None if time_limit == None else start + time_limit
+    _anytime = _AnytimeSearch(cost, start, on_improvement)
+    _budget = _SearchBudget(deadline, max_nodes, max_memory)
+    try:
+        seek_plan(state, todo_list, [], 0)
+        if _anytime.best_plan != False:
+            _budget.stats.status = "plan-found"
+        else:
+            _budget.stats.status = "no-plan"
+    except _SearchInterrupted as e:
+        _budget.stats.status = e.status
+    finally:
+        search = _anytime
+        search_stats = _budget.stats
+        _anytime = None
+        _budget = None
+    end = time.time()
+    search_stats.runtime = end - start
+    if verbose >= 1:
+        print("FP> status =", search_stats.status)
+        print("FP> nodes expanded =", search_stats.nodes)
+        print("FP> runtime =", end - start)
+        print("FP> result =", search.best_plan)
+    return search.best_plan
+
+
+class _AnytimeSearch:
+    """The incumbent plan and settings of a find_plan_anytime call."""
+
+    def __init__(self, cost, start, on_improvement):
+        self.cost = cost
+        self.start = start
+        self.on_improvement = on_improvement
+        self.best_plan = False
+        self.best_cost = None
+
+    def prune(self, state, plan, depth):
+        """Return True if the partial plan can't lead to a cheaper plan."""
+        if self.best_cost != None and self.cost(state, plan) >= self.best_cost:
+            if verbose >= 3:
+                print(f"depth {depth} pruned, cost >= {self.best_cost}")
+            return True
+        return False
+
+    def record(self, state, plan):
+        """Make plan, which prune has let through, the new incumbent."""
+        self.best_plan = plan
+        self.best_cost = self.cost(state, plan)
+        if verbose >= 1:
+            elapsed = time.time() - self.start
+            print(
+                f"FP> improved plan: cost = {self.best_cost},",
+                f"length = {len(plan)}, found after {elapsed} s",
+            )
+        if self.on_improvement != None:
+            self.on_improvement(plan, self.best_cost)
+
+
+# The find_plan_anytime call in progress, if any
+_anytime = None
+
+
+################################################################################
+# Searching the alternatives at a choice point in parallel
+
+
+parallel_workers = 0
+"""
+If parallel_workers is greater than 1, find_plan follows the search from the
+initial todo_list until it reaches the first choice point, i.e., the first
+task, unigoal, or multigoal that has more than one applicable method. It then
+searches below each of those alternatives in a separate process, using a pool
+of up to parallel_workers processes, and terminates the remaining workers as
+soon as it has its answer.
+
+Each worker gets what is left of find_plan's time, node, and memory budget at
+the choice point, and spends it separately, so the workers may expand up to
+parallel_workers times as many nodes in total as max_nodes allows. Anything
+the workers record, e.g., in a MethodStatistics policy, stays in the workers.
+
+The workers are forked where the platform supports it, so they inherit any
+module-level data that the domain's methods rely on. The domain, states, and
+todo_list items must be picklable, e.g., methods can't be lambdas.
+"""
+
+deterministic_parallel = True
+"""
+If deterministic_parallel is True, the parallel search returns the plan found
+below the first alternative (in method order) that has one, which is the plan
+the sequential search would return. If it is False, the parallel search
+returns whichever plan a worker finds first.
+"""
+
+
+def _seek_plan_in_parallel(state, todo_list):
+    """
+    Parallel counterpart of seek_plan(state, todo_list, [], 0); see
+    parallel_workers and deterministic_parallel.
+    """
+    alternatives = _choice_point(state, todo_list, [], 0)
+    if len(alternatives) <= 1:
+        return seek_plan(*alternatives[0]) if alternatives else False
+
+    if verbose >= 2:
+        print(f"FP> searching {len(alternatives)} alternatives in parallel")
+    settings = (verbose, verify_goals, _budget.limits())
+    jobs = [(current_domain, settings, alt) for alt in alternatives]
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context()
+    # leaving the with-block terminates the workers that are still searching
+    with context.Pool(min(parallel_workers, len(alternatives))) as pool:
+        if deterministic_parallel:
+            results = pool.imap(_seek_plan_in_worker, jobs)
+        else:
+            results = pool.imap_unordered(_seek_plan_in_worker, jobs)
+        for (result, stats) in results:
+            _budget.merge(stats)
+            if result != False and result != None:
+                return result
+    return False
+
+
+def _choice_point(state, todo_list, plan, depth):
+    """
+    Follow the search for as long as there is only one way to continue, and
+    return the list of (state, todo_list, plan, depth, checks) alternatives
+    at the first choice point, in the order seek_plan would try them. The
+    list contains just one alternative, with an empty todo_list, if the
+    search finds a plan before reaching a choice point, and is empty if it
+    fails.
+    """
+    alternatives = [(state, todo_list, plan, depth, None)]
+    while len(alternatives) == 1 and alternatives[0][1]:
+        (state, todo_list, plan, depth, checks) = alternatives[0]
+        if verbose >= 2:
+            todo_string = "[" + ", ".join([_item_to_string(x) for x in todo_list]) + "]"
+            print(f"depth {depth} todo_list " + todo_string)
+        if _budget is not None:
+            _budget.expand(plan, depth)
+        if checks is not None:
+            checks = _complete_checks(state, todo_list, checks)
+        alternatives = list(_alternatives(state, todo_list, plan, depth, checks))
+    return alternatives
+
+
+def _seek_plan_in_worker(job):
+    """
+    Run seek_plan on one alternative in a worker process, and return the
+    result together with the worker's SearchStats.
+    """
+    global current_domain, verbose, verify_goals, _budget
+    (domain, settings, alternative) = job
+    current_domain = domain
+    (verbose, verify_goals, limits) = settings
+    sys.setrecursionlimit(5000)
+    _budget = _SearchBudget(*limits)
+    try:
+        result = seek_plan(*alternative)
+    except _SearchInterrupted as e:
+        result = False
+        _budget.stats.status = e.status
+    return (result, _budget.stats)
+
+
 ################################################################################
 # An actor
 
 
-def run_lazy_lookahead(state, todo_list, max_tries=10):
+def run_lazy_lookahead(state, todo_list, max_tries=10, incremental=False):
     """
     An adaptation of the run_lazy_lookahead algorithm from Ghallab et al.
     (2016), Automated Planning and Acting. It works roughly like this:
@@ -921,7 +1813,13 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
     Arguments:
       - 'state' is a state;
       - 'todo_list' is a list of tasks, goals, and multigoals;
-      - max_tries is a bound on how many times to execute the outer loop.
+      - max_tries is a bound on how many times to execute the outer loop;
+      - if incremental is True, a command failure doesn't make it plan from
+        scratch. Instead it keeps the decomposition of the last plan, and
+        re-refines, in the current state, the nearest task or goal above the
+        failed action together with the rest of that plan's todo_list,
+        moving further up the decomposition whenever that fails (see
+        _repair_plan). It only calls find_plan again if none of them works.
 
     Note: whenever run_lazy_lookahead encounters an action for which there is
     no corresponding command definition, it uses the action definition instead.
@@ -932,14 +1830,19 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
         print(f"RLL> initial state: {state.__name__}")
         print("RLL> To do:", todo_list)
 
+    plan = None
     for tries in range(1, max_tries + 1):
-        if verbose >= 1:
-            ordinals = {1: "st", 2: "nd", 3: "rd"}
-            if ordinals.get(tries):
-                print(f"RLL> {tries}{ordinals.get(tries)} call to find_plan:\n")
+        if plan == None:
+            if verbose >= 1:
+                ordinals = {1: "st", 2: "nd", 3: "rd"}
+                if ordinals.get(tries):
+                    print(f"RLL> {tries}{ordinals.get(tries)} call to find_plan:\n")
+                else:
+                    print(f"RLL> {tries}th call to find_plan:\n")
+            if incremental:
+                (plan, trace) = _find_plan_with_trace(state, todo_list)
             else:
-                print(f"RLL> {tries}th call to find_plan:\n")
-        plan = find_plan(state, todo_list)
+                plan = find_plan(state, todo_list)
         if plan == False or plan == None:
             if verbose >= 1:
                 raise Exception(f"run_lazy_lookahead: find_plan has failed")
@@ -952,7 +1855,8 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
             if verbose >= 2:
                 state.display(heading="> final state")
             return state
-        for action in plan:
+        failed_step = None
+        for (step, action) in enumerate(plan):
             command_name = "c_" + action[0]
             command_func = current_domain._command_dict.get(command_name)
             if command_func == None:
@@ -970,13 +1874,18 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
                     print(
                         f"RLL> WARNING: command {command_name} failed; will call find_plan."
                     )
-                    break
+                failed_step = step
+                break
             else:
                 if verbose >= 2:
                     new_state.display()
                 state = new_state
+        if incremental and failed_step != None:
+            (plan, trace) = _repair_plan(state, trace, failed_step)
+        else:
+            plan = None
         # if state != False then we're here because the plan ended
-        if verbose >= 1 and state:
+        if verbose >= 1 and state and failed_step == None:
             print(f"RLL> Plan ended; will call find_plan again.")
 
     if verbose >= 1:
@@ -986,6 +1895,66 @@ def run_lazy_lookahead(state, todo_list, max_tries=10):
     return state
 
 
+# While _find_plan_with_trace is running, the list that seek_plan adds the
+# nodes on the path to the plan to.
+_trace = None
+
+
+def _find_plan_with_trace(state, todo_list, depth=0, checks=None):
+    """
+    Call seek_plan(state, todo_list, [], depth, checks), and return a pair
+    (plan, trace). If a plan was found, trace is the plan's decomposition:
+    the list of (todo_list, position, depth, checks) arguments of the
+    seek_plan calls on the path to the plan, in the order they were made,
+    where position is the number of actions in the plan before the node.
+    """
+    global _trace
+    _get_dispatch()
+    sys.setrecursionlimit(5000)
+    _trace = []
+    try:
+        plan = seek_plan(state, todo_list, [], depth, checks)
+    finally:
+        trace = _trace
+        _trace = None
+    trace.reverse()
+    return (plan, trace)
+
+
+def _repair_plan(state, trace, failed_step):
+    """
+    The action at position failed_step of the plan whose decomposition is
+    'trace' has failed, and 'state' is the current state. Go up the
+    decomposition from the failed action, and for each task, unigoal, or
+    multigoal whose subtree contains it, try to re-refine it, followed by the
+    items that came after it in its todo_list, in 'state'. The items that
+    came after it are reused as they are, and the search only has to redo
+    the failed subtree. Return the first (plan, trace) that works, or
+    (None, None) if none of them does.
+    """
+    # the node for the failed action is the last node at its position
+    node_index = max(i for (i, node) in enumerate(trace) if node[1] == failed_step)
+    shortest = len(trace[node_index][0])
+    for i in range(node_index - 1, -1, -1):
+        (todo_list, position, depth, checks) = trace[i]
+        # the node is above the failed action if the todo_list never got
+        # back down to the rest of the node's todo_list in between
+        is_ancestor = len(todo_list) - 1 < shortest
+        shortest = min(shortest, len(todo_list))
+        item1 = todo_list[0]
+        if not is_ancestor or (
+            not isinstance(item1, Multigoal)
+            and item1[0] in current_domain._action_dict
+        ):
+            continue
+        if verbose >= 1:
+            print(f"RLL> re-refining {_item_to_string(item1)} at depth {depth}")
+        (plan, new_trace) = _find_plan_with_trace(state, todo_list, depth, checks)
+        if plan != False and plan != None:
+            return (plan, new_trace)
+    return (None, None)
+
+
 def _apply_command_and_continue(state, command, args):
     """
     _apply_command_and_continue applies 'command' by retrieving its
@@ -0,0 +1,210 @@
+"""
+A single-pass parser for the PDDL problem files of the blocks and satellite
+domains. A problem file is read once, in chunks, each chunk is split into
+tokens, and the :objects, :init, and :goal sections are read as
+S-expressions as the tokens stream past, so atoms can span lines and share
+lines, and large files (the slew_time facts of a satellite problem grow with
+the square of the number of targets) are never held in memory as a whole.
+Numeric fluents such as (= (slew_time a b) 3.5) become the atom
+('slew_time', 'a', 'b', '3.5'), as a FluentAtom, so that they can be told
+apart from propositions whose last argument is an object with a numeric name.
+
+To keep the number of tokens down, an atom that doesn't contain a comment
+and isn't cut in two by a chunk boundary, which is almost every atom, is
+matched as a single token, e.g., "(on a b)" or "(= (fuel s) 10)", instead
+of one token per parenthesis and name.
+
+Only what the problem ingestor needs is supported: a goal is a conjunction
+of atoms, and the other sections of the problem (e.g., :metric) are skipped.
+"""
+
+import re
+from itertools import chain
+from typing import Iterable, Iterator, TextIO
+
+_COMMENTS = re.compile(r";[^\n]*")
+
+# a numeric fluent, a flat expression that doesn't start with a keyword
+# (i.e., an atom), a parenthesis, or a name or number
+_TOKENS = re.compile(
+    r"\(\s*=\s*\([^()]*\)\s*[^\s()]+\s*\)|\((?!\s*:)[^()]*\)|[()]|[^\s()]+"
+)
+
+# how much of a problem file is read and tokenized at a time
+chunkSize = 1 << 20
+
+
+# A ground atom is read as its predicate list [name, *args], which the state
+# builders consume directly, without wrapping each one in an object.
+Atom = list[str]
+
+
+class FluentAtom(list):
+    """The predicate list of a numeric fluent, read from an (= ...) form."""
+
+
+def tokenize(text: str) -> list[str]:
+    if ";" in text:
+        text = _COMMENTS.sub("", text)
+    return _TOKENS.findall(text)
+
+
+def tokenizeFile(f: TextIO) -> Iterator[str]:
+    """
+    Returns an iterator over the tokens of a file, which reads it chunkSize
+    characters at a time. Chunks are cut after their last newline, so that
+    no token or comment is split between two chunks.
+    """
+    return chain.from_iterable(_tokenizeChunks(f))
+
+
+def _tokenizeChunks(f: TextIO) -> Iterator[list[str]]:
+    rest = ""
+    for chunk in iter(lambda: f.read(chunkSize), ""):
+        chunk = rest + chunk
+        end = chunk.rfind("\n") + 1
+        rest = chunk[end:]
+        yield tokenize(chunk[:end])
+    yield tokenize(rest)
+
+
+def iterProblem(tokens: Iterable[str]) -> Iterator[tuple[str, str | Atom]]:
+    """
+    Yields a (section, item) pair for each object and atom of the problem
+    whose tokens are given, in the order they appear, where section is
+    ":objects", ":init", or ":goal", and item is an object name or an atom.
+    """
+    tokens = iter(tokens)
+    depth = 0
+    for token in tokens:
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif token[0] == "(":
+            # a flat expression outside the sections, e.g., (problem p1)
+            continue
+        elif depth == 2 and token == ":objects":
+            yield from ((":objects", name) for name in _readObjects(tokens))
+            depth -= 1
+        elif depth == 2 and token == ":init":
+            for token in tokens:
+                if token == ")":
+                    break
+                if token == "(":
+                    yield (":init", _readAtom(tokens))
+                elif token[0] == "(":
+                    yield (":init", _splitAtom(token))
+                else:
+                    raise ValueError(f"expected an atom in :init, not {token}")
+            depth -= 1
+        elif depth == 2 and token == ":goal":
+            yield from ((":goal", atom) for atom in _readGoal(tokens))
+            depth -= 1
+
+
+def parseProblem(text: str) -> tuple[list[str], list[Atom], list[Atom]]:
+    """Returns the objects, initial atoms, and goal atoms of the problem."""
+    return _collectSections(iterProblem(tokenize(text)))
+
+
+def readProblemFile(problemFile: str) -> tuple[list[str], list[Atom], list[Atom]]:
+    """Same as parseProblem, for the problem in problemFile."""
+    with open(problemFile) as f:
+        return readProblem(f)
+
+
+def readProblem(f: TextIO) -> tuple[list[str], list[Atom], list[Atom]]:
+    """Same as parseProblem, for the problem read from f, e.g., sys.stdin."""
+    return _collectSections(iterProblem(tokenizeFile(f)))
+
+
+def _collectSections(items: Iterator[tuple[str, str | Atom]]) -> tuple:
+    sections = {":objects": [], ":init": [], ":goal": []}
+    for section, item in items:
+        sections[section].append(item)
+    return (sections[":objects"], sections[":init"], sections[":goal"])
+
+
+def _readList(tokens: Iterator[str]) -> list:
+    """
+    Reads the rest of an S-expression whose "(" has been read. The atoms
+    that were matched as single tokens are read as their predicate lists.
+    """
+    expression = []
+    for token in tokens:
+        if token == ")":
+            return expression
+        if token == "(":
+            expression.append(_readList(tokens))
+        elif token[0] == "(":
+            expression.append(_splitAtom(token))
+        else:
+            expression.append(token)
+    raise ValueError("unbalanced parentheses")
+
+
+def _readAtom(tokens: Iterator[str]) -> Atom:
+    """Reads the rest of an atom whose "(" has been read."""
+    predicate = []
+    for token in tokens:
+        if token == ")":
+            return predicate
+        if token[0] == "(":
+            # a numeric fluent, (= (f args) value)
+            if token == "(":
+                fluent = _readAtom(tokens)
+            else:
+                fluent = _splitAtom(token)
+            value = next(tokens, ")")
+            if predicate != ["="] or value in ("(", ")") or next(tokens, None) != ")":
+                raise ValueError(f"unsupported atom: ({' '.join(predicate)} ...")
+            fluent.append(value)
+            return FluentAtom(fluent)
+        predicate.append(token)
+    raise ValueError("unbalanced parentheses")
+
+
+def _splitAtom(token: str) -> list[str]:
+    """Returns the predicate list of an atom that was matched as one token."""
+    predicate = token[1:-1].replace("(", " ").replace(")", " ").split()
+    if predicate and predicate[0] == "=":
+        return FluentAtom(predicate[1:])
+    return predicate
+
+
+def _readObjects(tokens: Iterator[str]) -> Iterator[str]:
+    """Yields the object names of an :objects section, skipping their types."""
+    for token in tokens:
+        if token == ")":
+            return
+        if token == "-":
+            next(tokens)
+        elif token != "(":
+            yield token
+
+
+def _readGoal(tokens: Iterator[str]) -> Iterator[Atom]:
+    for token in tokens:
+        if token == ")":
+            return
+        if token == "(":
+            goal = _readList(tokens)
+        elif token[0] == "(":
+            goal = _splitAtom(token)
+        else:
+            raise ValueError(f"expected a goal, not {token}")
+        if goal and goal[0] == "and":
+            yield from (_toAtom(atom) for atom in goal[1:])
+        else:
+            yield _toAtom(goal)
+
+
+def _toAtom(expression: list) -> Atom:
+    if len(expression) == 3 and expression[0] == "=":
+        (_, fluent, value) = expression
+        if isinstance(fluent, list) and isinstance(value, str):
+            expression = FluentAtom(fluent + [value])
+    if not expression or not all(isinstance(x, str) for x in expression):
+        raise ValueError(f"unsupported atom: {expression}")
+    return expression
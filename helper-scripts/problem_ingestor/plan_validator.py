@@ -0,0 +1,275 @@
+#! /usr/bin/env python3.10
+
+"""
+Replays plans against a problem's initial state with the blocks_htn or
+satellites_htn actions, and reports whether each plan can be executed, the
+first step that can't, whether the goals hold at the end, and the resources
+the plan used.
+
+Usage:
+    plan_validator.py DOMAIN DOMAIN_FILE PROBLEM_FILE PLAN_FILE
+    plan_validator.py --batch=MANIFEST [--processes=N]
+
+Each line of MANIFEST has the four arguments of the first form. A batch
+parses each problem once, however many plans it has, and validates the
+problems in parallel.
+
+A PLAN_FILE can hold the output of problem_ingestor.py (the last
+"FP> result =" line is used), the output of Metric-FF (the numbered plan
+steps are used), or a Python list of action tuples. Metric-FF's action
+names and arguments are mapped to the HTN actions' names and argument
+order.
+
+Note that the HTN states keep one calibration target and one supported mode
+per instrument, so a Metric-FF plan that relies on another one is reported
+as failing at that step.
+"""
+
+import ast
+import multiprocessing
+import re
+import sys
+
+import gtpyhop
+import problem_ingestor as pi
+
+# Metric-FF (PDDL) action names that differ from the HTN action names
+PDDL_ACTION_NAMES = {"pick-up": "pickup", "put-down": "putdown"}
+
+
+class ValidationResult:
+    planFile: str
+    valid: bool
+    numSteps: int
+    failedStep: int | None
+    failedAction: tuple | None
+    goalsAchieved: bool
+    unmetGoals: list[str]
+    resources: dict
+    error: str | None
+
+    def __init__(self, planFile: str) -> None:
+        self.planFile = planFile
+        self.valid = False
+        self.numSteps = 0
+        self.failedStep = None
+        self.failedAction = None
+        self.goalsAchieved = False
+        self.unmetGoals = []
+        self.resources = {}
+        self.error = None
+
+    def display(self) -> None:
+        resources = ", ".join(f"{key} = {val}" for key, val in self.resources.items())
+        if self.valid:
+            print(f"VALID {self.planFile}: {self.numSteps} steps, {resources}")
+        elif self.error is not None:
+            print(f"INVALID {self.planFile}: {self.error}")
+        elif self.failedStep is not None:
+            action = " ".join(str(x) for x in self.failedAction)
+            print(
+                f"INVALID {self.planFile}: step {self.failedStep} ({action}) failed, {resources}"
+            )
+        else:
+            unmetGoals = ", ".join(self.unmetGoals)
+            print(
+                f"INVALID {self.planFile}: goals not achieved after {self.numSteps} steps ({unmetGoals}), {resources}"
+            )
+
+
+class ProblemContext:
+    """
+    The parsed problem, initial state, and goal that every plan for the same
+    problem is validated against.
+    """
+
+    def __init__(self, domain: str, domainFile: str, problemFile: str) -> None:
+        self.problem = pi.Problem(domain, domainFile, problemFile)
+        pi.initializeForDomain(self.problem)
+        self.state_0 = pi.generateInitialState(self.problem)
+        self.state_g = pi.generateGoalState(self.problem)
+        pi.initializeForProblem(self.problem, self.state_0, self.state_g)
+        self.objectNames = getObjectNames(self.problem)
+
+    def validate(self, planFile: str) -> ValidationResult:
+        result = ValidationResult(planFile)
+        try:
+            with open(planFile) as f:
+                (plan, fromPddl) = readPlan(f.read())
+            plan = [toHtnAction(step, self.objectNames, fromPddl) for step in plan]
+        except (OSError, ValueError, SyntaxError) as e:
+            result.error = f"could not read plan: {e}"
+            return result
+
+        state = self.state_0.copy()
+        for (index, step) in enumerate(plan):
+            action = gtpyhop.current_domain._action_dict.get(step[0])
+            try:
+                newState = action(state, *step[1:]) if action else None
+            except (KeyError, TypeError):
+                newState = None
+            if not newState:
+                result.failedStep = index
+                result.failedAction = step
+                break
+            state = newState
+
+        result.numSteps = len(plan)
+        result.resources = getResources(self.problem, state)
+        result.unmetGoals = getUnmetGoals(state, self.state_g)
+        result.goalsAchieved = not result.unmetGoals
+        result.valid = result.failedStep is None and result.goalsAchieved
+        return result
+
+
+def readPlan(text: str) -> tuple[list[tuple], bool]:
+    """
+    Returns the plan in text, and whether it is a Metric-FF (PDDL) plan
+    rather than an HTN plan.
+    """
+    results = re.findall(r"FP> result = (\[.*\])", text)
+    if results:
+        return (ast.literal_eval(results[-1]), False)
+
+    steps = re.findall(r"^\s*(?:step\s+)?\d+:\s+(.+)$", text, re.M)
+    if steps:
+        return ([tuple(step.lower().split()) for step in steps], True)
+
+    plan = ast.literal_eval(text.strip())
+    if not isinstance(plan, list):
+        raise ValueError("not a list of actions")
+    return (plan, False)
+
+
+def getObjectNames(problem: pi.Problem) -> dict[str, str]:
+    """Map the lowercased name of each object to its name in the problem."""
+    names = {}
+    for predicate in problem.initialAtoms + problem.goalAtoms:
+        for arg in predicate[1:]:
+            names[str(arg).lower()] = arg
+    return names
+
+
+def toHtnAction(step: tuple, objectNames: dict[str, str], fromPddl: bool) -> tuple:
+    if not fromPddl:
+        return tuple(step)
+
+    name = PDDL_ACTION_NAMES.get(step[0], step[0])
+    args = [objectNames.get(arg, arg) for arg in step[1:]]
+    # PDDL's turn_to is (?s ?d_new ?d_prev); the HTN action is (sat, old, new)
+    if name == "turn_to" and len(args) == 3:
+        args = [args[0], args[2], args[1]]
+    return (name, *args)
+
+
+def getUnmetGoals(state: gtpyhop.State, goal: gtpyhop.Multigoal) -> list[str]:
+    unmetGoals = []
+    for stateVar in goal.state_vars():
+        goalVals = vars(goal)[stateVar]
+        # the goal states also hold numeric fluents such as fuel_used, which
+        # aren't goals
+        if not isinstance(goalVals, dict):
+            continue
+        stateVals = vars(state).get(stateVar, {})
+        for arg, val in goalVals.items():
+            if stateVals.get(arg) != val:
+                unmetGoals.append(f"{stateVar}[{arg}] = {val}")
+    return unmetGoals
+
+
+def getResources(problem: pi.Problem, state: gtpyhop.State) -> dict:
+    if problem.isSatelliteDomain():
+        return {
+            "fuel used": state.fuel_used,
+            "data stored": state.data_stored,
+            "min fuel left": min(state.fuel.values(), default=0),
+        }
+    return {}
+
+
+def validatePlans(job: tuple) -> list[ValidationResult]:
+    (domain, domainFile, problemFile, planFiles) = job
+    try:
+        context = ProblemContext(domain, domainFile, problemFile)
+    except Exception as e:
+        results = []
+        for planFile in planFiles:
+            result = ValidationResult(planFile)
+            result.error = f"could not load problem {problemFile}: {e}"
+            results.append(result)
+        return results
+    return [context.validate(planFile) for planFile in planFiles]
+
+
+def validateBatch(manifestFile: str, processes: int | None = None) -> list:
+    """
+    Validate every plan listed in manifestFile, parsing each problem once.
+    Returns the results in manifest order. A nonblank line that isn't of the
+    form DOMAIN DOMAIN_FILE PROBLEM_FILE PLAN_FILE gets an invalid result,
+    named after its line number, with the error.
+    """
+    jobs: dict[tuple, list[str]] = {}
+    order: list[str | ValidationResult] = []
+    with open(manifestFile) as f:
+        for lineNumber, line in enumerate(f, 1):
+            fields = line.split()
+            if not fields:
+                continue
+            if len(fields) != 4:
+                result = ValidationResult(f"{manifestFile}:{lineNumber}")
+                result.error = f"expected 4 fields in manifest line, found {len(fields)}"
+                order.append(result)
+                continue
+            (domain, domainFile, problemFile, planFile) = fields
+            jobs.setdefault((domain, domainFile, problemFile), []).append(planFile)
+            order.append(planFile)
+
+    jobList = [(*key, planFiles) for key, planFiles in jobs.items()]
+    with multiprocessing.Pool(processes) as pool:
+        resultLists = pool.map(validatePlans, jobList)
+
+    byPlanFile = {}
+    for results in resultLists:
+        for result in results:
+            byPlanFile.setdefault(result.planFile, []).append(result)
+    return [
+        entry if isinstance(entry, ValidationResult) else byPlanFile[entry].pop(0)
+        for entry in order
+    ]
+
+
+def main():
+    gtpyhop.verbose = 0
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+
+    manifestFile = None
+    processes = None
+    for option in options:
+        if option.startswith("--batch="):
+            manifestFile = option.split("=", 1)[1]
+        elif option.startswith("--processes="):
+            processes = int(option.split("=", 1)[1])
+        else:
+            print(f"ERROR: Unknown option: {option}")
+            return
+
+    if manifestFile is not None:
+        results = validateBatch(manifestFile, processes)
+    elif len(args) == 4:
+        results = validatePlans((args[0], args[1], args[2], [args[3]]))
+    else:
+        print(f"ERROR: Incorrect number of arguments: {len(sys.argv)}")
+        return
+
+    for result in results:
+        result.display()
+    numValid = sum(1 for result in results if result.valid)
+    print(f"INFO: {numValid} of {len(results)} plans valid")
+    if numValid != len(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
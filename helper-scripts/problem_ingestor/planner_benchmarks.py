@@ -0,0 +1,309 @@
+#! /usr/bin/env python3.10
+
+"""
+Benchmarks of the planner's core operations, timed in-process on a fixed
+corpus of satellite and blocks problems that is generated from fixed seeds
+(see problem_generators), so that runs are comparable across commits
+without process startup or problem generation in the timings.
+
+Usage:
+    planner_benchmarks.py run [--output=FILE] [--repeat=N] [--min-time=SECONDS]
+    planner_benchmarks.py compare BASELINE_FILE RESULTS_FILE [--threshold=FRACTION]
+
+run times each benchmark on each problem of the corpus and writes the
+results to FILE (benchmarks_<TIMESTAMP>.json by default). Each benchmark is
+run N times (5 by default), each time in a loop of at least SECONDS (0.2 by
+default), and its result is the best and the median time per call. The
+benchmarks are:
+    - state_copy: State.copy of the initial state;
+    - seek_plan_node: find_plan's time per node (seek_plan call);
+    - getCheapestCollection_agenda and getCheapestCollection_engine:
+      satellites_htn.methods.getCheapestCollection with the collection
+      agenda (the default) and with the cost engine (use_cost_engine), on a
+      copy of the initial state in which one satellite has changed since the
+      last call, as after an action;
+    - is_done: blocks_htn.methods.is_done for every block, starting with an
+      empty done cache;
+    - find_plan: gtpyhop.find_plan, from the initial state.
+
+compare prints the change in each benchmark's best time between two runs and
+flags the benchmarks that got slower by more than FRACTION (0.1 by default);
+it exits with status 1 if any did.
+"""
+
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import gtpyhop
+import problem_generators
+import problem_ingestor as pi
+
+# The corpus: numbers of targets (satellite) and blocks (blocks) and the seeds
+# of the problems of each size.
+satelliteSizes = [5, 20, 40]
+blocksSizes = [10, 25, 50]
+corpusSeeds = [722, 723]
+
+FORMAT_VERSION = 1
+
+
+class CorpusProblem:
+    """A problem of the corpus, declared and ready to be planned for."""
+
+    name: str
+    problem: pi.Problem
+
+    def __init__(self, name: str, problem: pi.Problem) -> None:
+        self.name = name
+        self.problem = problem
+
+    def initialize(self) -> tuple[gtpyhop.State, gtpyhop.Multigoal]:
+        """
+        Declares the problem's domain and returns its initial state and goal,
+        with the per-problem indexes and caches of its methods built.
+        """
+        pi.initializeForDomain(self.problem)
+        state = pi.generateInitialState(self.problem)
+        goal = pi.generateGoalState(self.problem)
+        pi.initializeForProblem(self.problem, state, goal)
+        return (state, goal)
+
+
+def getCorpus() -> list[CorpusProblem]:
+    corpus = []
+    for numTargets in satelliteSizes:
+        for seed in corpusSeeds:
+            generated = problem_generators.generateSatelliteProblem(
+                seed, 10, 5, 5, numTargets, 5
+            )
+            corpus.append(
+                CorpusProblem(f"satellite-{numTargets}-{seed}", generated.toProblem())
+            )
+    for numBlocks in blocksSizes:
+        for seed in corpusSeeds:
+            generated = problem_generators.generateBlocksProblem(
+                seed, numBlocks, f"bench.{numBlocks}.{seed}"
+            )
+            corpus.append(
+                CorpusProblem(f"blocks-{numBlocks}-{seed}", generated.toProblem())
+            )
+    return corpus
+
+
+def timeCall(func, repeat: int, minTime: float, setup=None) -> dict:
+    """
+    Returns the best and the median of repeat measurements of the time per
+    call of func, each of which calls it in a loop that runs for at least
+    minTime seconds. If setup is given, it's called before each call of
+    func, untimed, and its result is passed to func.
+    """
+    times = []
+    for _ in range(repeat):
+        calls = 0
+        elapsed = 0.0
+        while elapsed < minTime or calls == 0:
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            func(*args)
+            elapsed += time.perf_counter() - start
+            calls += 1
+        times.append(elapsed / calls)
+    return {"best": min(times), "median": statistics.median(times)}
+
+
+def benchmarkProblem(corpusProblem: CorpusProblem, repeat: int, minTime: float):
+    """Yields the (benchmark name, result) pairs of the benchmarks of a problem."""
+    problem = corpusProblem.problem
+    name = corpusProblem.name
+    (state, goal) = corpusProblem.initialize()
+
+    yield (f"state_copy/{name}", timeCall(state.copy, repeat, minTime))
+
+    if problem.isSatelliteDomain():
+        from satellites_htn import costs, methods
+
+        engines = {"agenda": False}
+        if costs.np is not None:
+            engines["engine"] = True
+        for engineName, useCostEngine in engines.items():
+            yield (
+                f"getCheapestCollection_{engineName}/{name}",
+                timeCheapestCollection(corpusProblem, useCostEngine, repeat, minTime),
+            )
+
+    elif problem.isBlocksDomain():
+        from blocks_htn import methods
+
+        blocks = list(state.pos)
+
+        def emptyCache():
+            state.done = methods.DoneCache()
+            return ()
+
+        def isDoneAll():
+            for block in blocks:
+                methods.is_done(block, state, goal)
+
+        yield (
+            f"is_done/{name}",
+            timeCall(isDoneAll, repeat, minTime, setup=emptyCache),
+        )
+
+    # find_plan and seek_plan_node time the same searches; each search
+    # starts from freshly built states, since the methods' caches live in them
+    nodes = []
+
+    def findPlan(state, goal):
+        gtpyhop.find_plan(state, [("achieve", goal)])
+        nodes.append(gtpyhop.search_stats.nodes)
+
+    findPlanResult = timeCall(findPlan, repeat, minTime, setup=corpusProblem.initialize)
+    yield (f"find_plan/{name}", findPlanResult)
+
+    numNodes = max(statistics.median(nodes), 1)
+    yield (
+        f"seek_plan_node/{name}",
+        {key: value / numNodes for key, value in findPlanResult.items()},
+    )
+
+
+def timeCheapestCollection(
+    corpusProblem: CorpusProblem, useCostEngine: bool, repeat: int, minTime: float
+) -> dict:
+    from satellites_htn import methods
+
+    default = methods.use_cost_engine
+    methods.use_cost_engine = useCostEngine
+    try:
+        (state, _) = corpusProblem.initialize()
+        # the first call keys the collections of every satellite
+        methods.getCheapestCollection(state)
+        sat = next(iter(methods.instruments_by_sat))
+
+        def changeOneSat():
+            changed = state.copy()
+            changed.changed_sats.add(sat)
+            return (changed,)
+
+        return timeCall(
+            methods.getCheapestCollection, repeat, minTime, setup=changeOneSat
+        )
+    finally:
+        methods.use_cost_engine = default
+
+
+def runBenchmarks(repeat: int = 5, minTime: float = 0.2) -> dict:
+    verbose = gtpyhop.verbose
+    gtpyhop.verbose = 0
+    try:
+        results = {}
+        for corpusProblem in getCorpus():
+            for name, result in benchmarkProblem(corpusProblem, repeat, minTime):
+                results[name] = result
+                print(f"INFO: {name}: {formatSeconds(result['best'])}")
+    finally:
+        gtpyhop.verbose = verbose
+
+    return {
+        "version": FORMAT_VERSION,
+        "created": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "minTime": minTime,
+        "results": results,
+    }
+
+
+def compareResults(baseline: dict, results: dict, threshold: float) -> list[str]:
+    """
+    Prints the change in the best time of each benchmark in both baseline
+    and results, and returns the names of those that got slower by more
+    than threshold (a fraction of the baseline time).
+    """
+    regressions = []
+    baselineResults = baseline["results"]
+    for name, result in results["results"].items():
+        if name not in baselineResults:
+            print(f"{name}: {formatSeconds(result['best'])} (new)")
+            continue
+
+        before = baselineResults[name]["best"]
+        after = result["best"]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name}: {formatSeconds(before)} -> {formatSeconds(after)} ({change:+.1%}){flag}"
+        )
+
+    for name in baselineResults.keys() - results["results"].keys():
+        print(f"{name}: missing")
+    return regressions
+
+
+def formatSeconds(seconds: float) -> str:
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.2f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.3f} s"
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    if not args or args[0] not in ("run", "compare"):
+        print("ERROR: Specify run or compare")
+        return
+
+    outputFile = None
+    repeat = 5
+    minTime = 0.2
+    threshold = 0.1
+    for option in options:
+        if option.startswith("--output="):
+            outputFile = option.split("=", 1)[1]
+        elif option.startswith("--repeat="):
+            repeat = int(option.split("=", 1)[1])
+        elif option.startswith("--min-time="):
+            minTime = float(option.split("=", 1)[1])
+        elif option.startswith("--threshold="):
+            threshold = float(option.split("=", 1)[1])
+        else:
+            print(f"ERROR: Unknown option: {option}")
+            return
+
+    if args[0] == "run":
+        if outputFile is None:
+            timestamp = str(datetime.utcnow().timestamp()).replace(".", "")
+            outputFile = f"benchmarks_{timestamp}.json"
+        results = runBenchmarks(repeat, minTime)
+        with open(outputFile, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"INFO: results written to {outputFile}")
+        return
+
+    if len(args) != 3:
+        print(f"ERROR: Incorrect number of arguments: {len(sys.argv)}")
+        return
+    with open(args[1]) as f:
+        baseline = json.load(f)
+    with open(args[2]) as f:
+        results = json.load(f)
+
+    regressions = compareResults(baseline, results, threshold)
+    if regressions:
+        print(f"ERROR: {len(regressions)} benchmarks regressed by more than {threshold:.0%}")
+        sys.exit(1)
+    print("INFO: no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,464 @@
+"""
+In-process versions of the problem generators that runTests.py used to run
+as subprocesses: satgen (satellite-generator/satgen.cc, as run with
+-c -n -u, i.e., untyped numeric problems) and bwstates
+(bwstates-src/bbwstates.c) followed by generate-prob-pddl.py.
+
+Both generators use exact ports of the C library random number generators
+the originals are seeded with (glibc's random() and drand48()), so for the
+same seed they generate the same problems, and toPddl() writes the same
+PDDL text, as the original programs. The problems are generated as the
+atoms pddl_parser reads from a PDDL file, so that toStates() can build the
+gtpyhop states without any PDDL being written or parsed. Blocks problems are
+translated by bwstates_pddl, which generate-prob-pddl.py is a command line
+interface of.
+"""
+
+import math
+import os
+import sys
+
+# bwstates_pddl is in helper-scripts, the parent of this directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bwstates_pddl
+
+
+class GlibcRandom:
+    """glibc's random(), as seeded by srandom(seed)."""
+
+    RAND_MAX = 2147483647
+
+    def __init__(self, seed: int) -> None:
+        # srandom takes an unsigned int, and the state holds int32s
+        seed &= 0xFFFFFFFF
+        if seed == 0:
+            seed = 1
+        word = seed - (1 << 32) if seed >= (1 << 31) else seed
+        self.table = [seed]
+        for _ in range(1, 31):
+            # C division, which truncates toward zero
+            hi = abs(word) // 127773 * (1 if word >= 0 else -1)
+            lo = word - hi * 127773
+            word = 16807 * lo - 2836 * hi
+            if word < 0:
+                word += 2147483647
+            self.table.append(word & 0xFFFFFFFF)
+        self.front = 3
+        self.rear = 0
+        for _ in range(310):
+            self.random()
+
+    def random(self) -> int:
+        table = self.table
+        value = (table[self.front] + table[self.rear]) & 0xFFFFFFFF
+        table[self.front] = value
+        self.front = (self.front + 1) % 31
+        self.rear = (self.rear + 1) % 31
+        return value >> 1
+
+
+class Drand48:
+    """drand48(), as seeded by srand48(seed)."""
+
+    def __init__(self, seed: int) -> None:
+        # glibc only uses the low 32 bits of the seed
+        self.x = ((seed & 0xFFFFFFFF) << 16) | 0x330E
+
+    def random(self) -> float:
+        self.x = (0x5DEECE66D * self.x + 0xB) & 0xFFFFFFFFFFFF
+        return self.x / 2**48
+
+
+class GeneratedProblem:
+    domain: str
+    name: str
+    objects: list[str]
+    initialAtoms: list[list[str]]
+    goalAtoms: list[list[str]]
+    # the names of the atoms that are numeric fluents
+    functions: set[str]
+
+    def __init__(self, domain: str, name: str) -> None:
+        self.domain = domain
+        self.name = name
+        self.objects = []
+        self.initialAtoms = []
+        self.goalAtoms = []
+        self.functions = set()
+
+    def toPddl(self) -> str:
+        if self.domain == "blocks":
+            return bwstates_pddl.atomsToPddl(
+                self.name, len(self.objects), self.initialAtoms, self.goalAtoms
+            )
+        return self.__toSatellitePddl()
+
+    def writePddl(self, fileName: str) -> None:
+        with open(fileName, "w") as f:
+            f.write(self.toPddl())
+
+    def toStates(self) -> tuple:
+        """Returns the problem's gtpyhop initial state and goal."""
+        import gtpyhop
+        import problem_ingestor
+
+        if self.domain == "blocks":
+            generateState = problem_ingestor.generateBlocksState
+        else:
+            generateState = problem_ingestor.generateSatelliteState
+        return (
+            generateState(self.initialAtoms, gtpyhop.State("state_0")),
+            generateState(self.goalAtoms, gtpyhop.Multigoal("state_g")),
+        )
+
+    def toProblem(self):
+        """Returns the problem as a problem_ingestor.Problem."""
+        import problem_ingestor
+
+        return problem_ingestor.Problem.fromAtoms(
+            self.domain, self.initialAtoms, self.goalAtoms
+        )
+
+    def __formatAtom(self, atom: list[str]) -> str:
+        if atom[0] in self.functions:
+            return f"(= ({' '.join(atom[:-1])}) {atom[-1]})"
+        return f"({' '.join(atom)})"
+
+    def __toSatellitePddl(self) -> str:
+        # the layout of satgen's output
+        lines = [f"(define (problem {self.name})\n(:domain satellite)\n(:objects\n"]
+        lines += [f"\t{name}\n" for name in self.objects]
+        lines.append(")\n(:init\n")
+        lines += [f"\t{self.__formatAtom(atom)}\n" for atom in self.initialAtoms]
+        lines.append(")\n(:goal (and\n")
+        lines += [f"\t{self.__formatAtom(atom)}\n" for atom in self.goalAtoms]
+        lines.append("))\n(:metric minimize (fuel-used))\n\n)\n")
+        return "".join(lines)
+
+
+################################################################################
+# Satellite problems (satgen)
+
+_TARGET_TYPES = ["Star", "GroundStation"]
+_OBSERVATION_TYPES = ["Star", "Phenomenon", "Planet"]
+_MODE_TYPES = ["infrared", "image", "spectrograph", "thermograph"]
+_SATELLITE_FUNCTIONS = {
+    "data",
+    "data_capacity",
+    "data-stored",
+    "fuel",
+    "fuel-used",
+    "slew_time",
+}
+
+
+class _Satgen:
+    """
+    satgen's objects, created in the same order and with the same random
+    numbers as satgen creates them. Modes, targets, and observations are
+    represented by their indexes into the corresponding lists.
+    """
+
+    def __init__(self, seed: int, tightness: float = 0.3) -> None:
+        self.rng = GlibcRandom(seed)
+        self.tightness = tightness
+        self.directionNames = []
+        self.slewTimes = []
+        self.modeNames = []
+        self.modeSupported = []
+        self.modeChoices = []
+        self.targetChoices = []
+        self.observations = []
+
+    def rnd(self, limit: int) -> int:
+        return int(float(limit) * self.rng.random() / (GlibcRandom.RAND_MAX + 1.0))
+
+    def rndFloat(self) -> float:
+        return self.rng.random() / (GlibcRandom.RAND_MAX + 1.0)
+
+    def selectSeveral(self, choices: list[int], n: int, fn=None) -> list[int]:
+        """
+        satgen's selection::selectSeveral, which picks n distinct choices and
+        then moves them, in reverse order, to the end of the choices.
+        """
+        selected = []
+        while choices and len(selected) < n:
+            choice = choices.pop(self.rnd(len(choices)))
+            if fn:
+                fn(choice)
+            selected.append(choice)
+        choices.extend(reversed(selected))
+        return selected
+
+    def selectDirection(self) -> int:
+        """satgen's selectOne over the targets and the observations."""
+        numTargets = len(self.targetChoices)
+        c = self.rnd(numTargets + len(self.observations))
+        if c < numTargets:
+            return self.targetChoices[self.rnd(numTargets)]
+        return self.observations[self.rnd(len(self.observations))]["direction"]
+
+    def newDirection(self, types: list[str]) -> int:
+        direction = len(self.directionNames)
+        slewTimes = []
+        for _ in range(direction):
+            a = self.rndFloat() * 100.0
+            b = self.rndFloat() * 100.0
+            slewTimes.append(b - a if a < b else a - b)
+        self.slewTimes.append(slewTimes)
+        self.directionNames.append(types[self.rnd(len(types))] + str(direction))
+        return direction
+
+    def newMode(self) -> None:
+        mode = len(self.modeNames)
+        self.modeNames.append(_MODE_TYPES[self.rnd(4)] + str(mode))
+        self.modeSupported.append(False)
+        self.modeChoices.append(mode)
+
+    def newObservation(self) -> None:
+        direction = self.newDirection(_OBSERVATION_TYPES)
+        interesting = self.rnd(10) < 9
+        images = self.selectSeveral(
+            self.modeChoices, 1 + self.rnd(len(self.modeNames) // 3)
+        )
+        dataSizes = [
+            1 + self.rnd(int(1000 * self.tightness))
+            for _ in range(len(self.modeNames))
+        ]
+        self.observations.append(
+            {
+                "direction": direction,
+                "interesting": interesting,
+                "images": images,
+                "dataSizes": dataSizes,
+            }
+        )
+
+    def newInstrument(self, instrument: int) -> dict:
+        def supported(mode: int) -> None:
+            self.modeSupported[mode] = True
+
+        modes = self.selectSeveral(self.modeChoices, 1 + self.rnd(3), supported)
+        targets = self.selectSeveral(
+            self.targetChoices, 1 + self.rnd(self.numTargets // 3)
+        )
+        for _ in targets:
+            # calibration times, which numeric problems don't use
+            self.rndFloat()
+        return {"id": instrument, "modes": modes, "targets": targets}
+
+    def newSatellite(self, satellite: int, maxInstruments: int, instrument: int):
+        start = self.selectDirection()
+        end = self.selectDirection()
+        interesting = self.rnd(5) < 2
+        fuel = 100 * (1 + self.rndFloat())
+        instruments = [
+            self.newInstrument(instrument + i)
+            for i in range(1 + self.rnd(maxInstruments))
+        ]
+        return {
+            "id": satellite,
+            "start": start,
+            "end": end,
+            "interesting": interesting,
+            "fuel": fuel,
+            "instruments": instruments,
+        }
+
+    def generate(
+        self,
+        numSats: int,
+        maxInstsPerSat: int,
+        numModes: int,
+        numTargets: int,
+        numObs: int,
+    ) -> GeneratedProblem:
+        for _ in range(numModes):
+            self.newMode()
+        self.numTargets = numTargets
+        for _ in range(numTargets):
+            self.targetChoices.append(self.newDirection(_TARGET_TYPES))
+        for _ in range(numObs):
+            self.newObservation()
+
+        satellites = []
+        numInstruments = 0
+        for i in range(numSats):
+            satellites.append(self.newSatellite(i, maxInstsPerSat, numInstruments))
+            numInstruments += len(satellites[-1]["instruments"])
+
+        problem = GeneratedProblem("satellite", "strips-sat-x-1")
+        problem.functions = _SATELLITE_FUNCTIONS
+        self.addObjects(problem, satellites)
+        self.addInit(problem, satellites)
+        self.addGoal(problem, satellites)
+        return problem
+
+    def addObjects(self, problem: GeneratedProblem, satellites: list) -> None:
+        objects = problem.objects
+        for sat in satellites:
+            objects.append(f"satellite{sat['id']}")
+            objects += [f"instrument{ins['id']}" for ins in sat["instruments"]]
+        objects += [self.modeNames[mode] for mode in self.modeChoices]
+        objects += [self.directionNames[target] for target in self.targetChoices]
+        objects += [self.directionNames[obs["direction"]] for obs in self.observations]
+
+    def addInit(self, problem: GeneratedProblem, satellites: list) -> None:
+        atoms = problem.initialAtoms
+        names = self.directionNames
+        for sat in satellites:
+            satName = f"satellite{sat['id']}"
+            atoms.append(["satellite", satName])
+            for ins in sat["instruments"]:
+                insName = f"instrument{ins['id']}"
+                atoms.append(["instrument", insName])
+                atoms += [
+                    ["supports", insName, self.modeNames[mode]] for mode in ins["modes"]
+                ]
+                atoms += [
+                    ["calibration_target", insName, names[target]]
+                    for target in ins["targets"]
+                ]
+            atoms += [
+                ["on_board", f"instrument{ins['id']}", satName]
+                for ins in sat["instruments"]
+            ]
+            atoms.append(["power_avail", satName])
+            atoms.append(["pointing", satName, names[sat["start"]]])
+            atoms.append(["data_capacity", satName, "1000"])
+            atoms.append(["fuel", satName, f"{sat['fuel']:.3g}"])
+
+        for mode in self.modeChoices:
+            atoms.append(["mode", self.modeNames[mode]])
+            atoms += [
+                [
+                    "data",
+                    names[obs["direction"]],
+                    self.modeNames[mode],
+                    str(obs["dataSizes"][mode]),
+                ]
+                for obs in self.observations
+            ]
+
+        directions = self.targetChoices + [obs["direction"] for obs in self.observations]
+        for direction in directions:
+            atoms.append(["direction", names[direction]])
+            for other, slewTime in enumerate(self.slewTimes[direction]):
+                slewTime = f"{slewTime:.4g}"
+                atoms.append(["slew_time", names[direction], names[other], slewTime])
+                atoms.append(["slew_time", names[other], names[direction], slewTime])
+
+        atoms.append(["data-stored", "0"])
+        atoms.append(["fuel-used", "0"])
+
+    def addGoal(self, problem: GeneratedProblem, satellites: list) -> None:
+        atoms = problem.goalAtoms
+        names = self.directionNames
+        for sat in satellites:
+            if sat["interesting"]:
+                atoms.append(["pointing", f"satellite{sat['id']}", names[sat["end"]]])
+        for obs in self.observations:
+            if obs["interesting"]:
+                atoms += [
+                    ["have_image", names[obs["direction"]], self.modeNames[mode]]
+                    for mode in obs["images"]
+                    if self.modeSupported[mode]
+                ]
+
+
+def generateSatelliteProblem(
+    seed: int,
+    numSats: int,
+    maxInstsPerSat: int,
+    numModes: int,
+    numTargets: int,
+    numObs: int,
+) -> GeneratedProblem:
+    """
+    Returns the problem that
+        satgen -c -n -u SEED NUM_SATS MAX_INSTS_PER_SAT NUM_MODES NUM_TARGETS NUM_OBS
+    generates.
+    """
+    return _Satgen(seed).generate(numSats, maxInstsPerSat, numModes, numTargets, numObs)
+
+
+################################################################################
+# Blocks problems (bwstates)
+
+
+def makeRatios(numBlocks: int) -> list[float]:
+    """
+    bwstates' make_ratio: ratios[n] is the fraction of the states of n blocks
+    in which a given block is clear.
+    """
+    ratios = [1.0]
+    for n in range(numBlocks):
+        ratios.append((n * ratios[n] + 1) / (n * (ratios[n] + 1) + 1))
+    return ratios
+
+
+def sampleBlocksState(numBlocks: int, rng: Drand48, ratios: list[float]) -> list[int]:
+    """
+    bwstates' make_state, which picks a state of numBlocks blocks uniformly
+    at random. Returns, for each block 1..numBlocks, the block it is on, or 0
+    if it is on the table.
+    """
+    on = [-1] * numBlocks
+    # the top and bottom blocks of the towers that aren't on anything yet
+    top = list(range(numBlocks))
+    bottom = list(range(numBlocks))
+    n = numBlocks
+    while n:
+        r = rng.random()
+        pc = ratios[n]
+        pt = 1 / ((n - 1) * ratios[n - 1] + 1)
+        if r > pc:
+            # put the last tower under one of the others
+            n -= 1
+            b = math.floor(((r - pc) / (1.0 - pc)) * n)
+            on[bottom[b]] = top[n]
+            bottom[b] = bottom[n]
+            continue
+
+        # the last tower's top block is to be clear
+        r /= pc
+        while r > pt:
+            # extend the tower downward
+            n -= 1
+            b = math.floor(rng.random() * n)
+            if n > b + 1:
+                (top[b], top[n - 1]) = (top[n - 1], top[b])
+                (bottom[b], bottom[n - 1]) = (bottom[n - 1], bottom[b])
+                b = n - 1
+            on[bottom[n]] = top[b]
+            top[b] = top[n]
+            r = rng.random()
+            pc = ratios[n]
+            pt = 1 / ((n - 1) * ratios[n - 1] + 1)
+        # put the tower on the table
+        n -= 1
+
+    return [block + 1 for block in on]
+
+
+def generateBlocksStates(seed: int, numBlocks: int) -> tuple[list[int], list[int]]:
+    """Returns the initial and goal states that bwstates -r SEED -n N prints."""
+    rng = Drand48(seed)
+    ratios = makeRatios(numBlocks)
+    initial = sampleBlocksState(numBlocks, rng, ratios)
+    goal = sampleBlocksState(numBlocks, rng, ratios)
+    return (initial, goal)
+
+
+def generateBlocksProblem(seed: int, numBlocks: int, name: str) -> GeneratedProblem:
+    """
+    Returns the problem that generate-prob-pddl.py translates the output of
+    bwstates -r SEED -n NUM_BLOCKS to, when that output is in a file called
+    name (e.g., test.10.1).
+    """
+    (initial, goal) = generateBlocksStates(seed, numBlocks)
+    problem = GeneratedProblem("blocks", bwstates_pddl.getProblemName(name))
+    problem.objects = [f"b{i + 1}" for i in range(numBlocks)]
+    problem.initialAtoms = bwstates_pddl.getStateAtoms(initial)
+    problem.goalAtoms = bwstates_pddl.getStateAtoms(goal)
+    return problem
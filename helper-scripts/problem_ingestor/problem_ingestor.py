@@ -3,12 +3,56 @@
 from enum import Enum
 from time import sleep
 import gtpyhop
-from pddlpy import DomainProblem
-from pddlpy.pddl import Atom
+import multiprocessing
+import os
+import compiled_problem
+import pddl_parser
+from pddl_parser import Atom
 import sys
 
 verbosity = 0
 
+# Plan blocks problems with blocks_htn.linear instead of gtpyhop's search;
+# also enabled by passing --linear on the command line.
+linearBlocksPlanner = False
+
+# If set, keep searching for cheaper plans (by fuel used for satellite
+# problems, by plan length for blocks problems) for up to this many seconds
+# instead of stopping at the first plan; also set by --anytime=SECONDS.
+anytimeTimeLimit = None
+
+# Budgets for gtpyhop's search (see gtpyhop.find_plan); the planner stops
+# and reports how far it got when it runs out of one of them. Also set by
+# --time-limit=SECONDS, --max-nodes=N, and --max-memory=MEGABYTES.
+searchTimeLimit = None
+searchMaxNodes = None
+searchMaxMemory = None
+
+# If greater than 1, gtpyhop's search explores the alternatives of its
+# choice points in a pool of this many worker processes (see
+# gtpyhop.parallel_workers); also set by --parallel-workers=N.
+parallelWorkers = None
+
+# If set, order the methods of each task by their success rates so far, which
+# are loaded from and saved back to this JSON file (see
+# gtpyhop.MethodStatistics); also set by --method-stats=FILE.
+methodStatisticsFile = None
+methodStatistics = None
+
+# If set, compile each PDDL problem file to a binary file next to it (see
+# compiled_problem) the first time it's planned for, and load that instead of
+# parsing the PDDL on later runs; also set by --compiled. Compiled problem
+# files can always be passed in place of PDDL files.
+useCompiledProblems = False
+
+# The problem file name that stands for the PDDL problem given on stdin, so
+# that a problem can be handed to the planner without writing it to disk.
+STDIN_PROBLEM = "-"
+
+# The domain that planProblems last declared in this process, so that it
+# only declares each domain once (see planProblems).
+batchDomain = None
+
 
 class BlocksPredicate(Enum):
     ON = "on"
@@ -43,23 +87,60 @@ class SatelliteFunctions(Enum):
 
 class Problem:
     domain: str
-    goalAtoms: set[Atom] | list[Atom]
-    initialAtoms: set[Atom] | list[Atom]
-
-    __INIT_START: str = "(:init"
-    __INIT_END: str = ")"
-    __GOAL_START: str = "(:goal (and"
-    __GOAL_END: str = "))"
+    goalAtoms: list[Atom]
+    initialAtoms: list[Atom]
+    # the two-argument numeric fluents of a compiled problem, which aren't in
+    # the atoms (see compiled_problem.MatrixView)
+    goalMatrices: dict
+    initialMatrices: dict
 
     def __init__(self, domain: str, domainFile: str, problemFile: str) -> None:
         self.domain = domain
-        if self.isBlocksDomain():
-            domainProblem = DomainProblem(domainFile, problemFile)
-            self.goalAtoms = domainProblem.goals()
-            self.initialAtoms = domainProblem.initialstate()
-        elif self.isSatelliteDomain():
-            self.goalAtoms = self.__generateGoalSatAtoms(problemFile)
-            self.initialAtoms = self.__generateInitialSatAtoms(problemFile)
+        self.goalMatrices = {}
+        self.initialMatrices = {}
+
+        if problemFile == STDIN_PROBLEM:
+            (_, self.initialAtoms, self.goalAtoms) = pddl_parser.readProblem(
+                sys.stdin
+            )
+            return
+
+        if useCompiledProblems and not compiled_problem.isCompiledProblem(
+            problemFile
+        ):
+            compiledFile = compiled_problem.getCompiledFileName(problemFile)
+            if not os.path.exists(compiledFile) or os.path.getmtime(
+                compiledFile
+            ) < os.path.getmtime(problemFile):
+                compiled_problem.compileProblem(problemFile, compiledFile)
+            problemFile = compiledFile
+
+        if compiled_problem.isCompiledProblem(problemFile):
+            compiled = compiled_problem.loadProblem(problemFile)
+            self.initialAtoms = compiled.initialAtoms
+            self.goalAtoms = compiled.goalAtoms
+            self.initialMatrices = compiled.initialMatrices
+            self.goalMatrices = compiled.goalMatrices
+        else:
+            (_, self.initialAtoms, self.goalAtoms) = pddl_parser.readProblemFile(
+                problemFile
+            )
+
+    @classmethod
+    def fromAtoms(
+        cls, domain: str, initialAtoms: list[Atom], goalAtoms: list[Atom]
+    ) -> "Problem":
+        """
+        Returns the problem with the given atoms, e.g., one generated in
+        memory by problem_generators, without reading a problem file.
+        """
+        problem = cls.__new__(cls)
+        problem.domain = domain
+        problem.initialAtoms = initialAtoms
+        problem.goalAtoms = goalAtoms
+        problem.goalMatrices = {}
+        problem.initialMatrices = {}
+        return problem
 
     def isSatelliteDomain(self) -> bool:
         return self.domain.lower() == "satellite"
@@ -67,49 +148,104 @@ class Problem:
     def isBlocksDomain(self) -> bool:
         return self.domain.lower() == "blocks"
 
-    def __generateGoalSatAtoms(self, problemFile: str) -> list[Atom]:
-        with open(problemFile) as f:
-            lines = f.readlines()
 
-        return self.__extractPredicates(lines, self.__GOAL_START, self.__GOAL_END)
+def runPlanner(problem: Problem) -> None:
+    initializeForDomain(problem)
+    result = planProblem(problem)
+    if methodStatistics is not None:
+        methodStatistics.save()
+    return result
 
-    def __generateInitialSatAtoms(self, problemFile: str) -> list[Atom]:
-        with open(problemFile) as f:
-            lines = f.readlines()
 
-        return self.__extractPredicates(lines, self.__INIT_START, self.__INIT_END)
+def planProblem(problem: Problem) -> None:
+    """
+    Plans for problem with the domain that initializeForDomain declared last,
+    which must be problem's domain.
+    """
+    state_0 = generateInitialState(problem)
+    state_g = generateGoalState(problem)
+    initializeForProblem(problem, state_0, state_g)
+    if parallelWorkers is not None:
+        gtpyhop.parallel_workers = parallelWorkers
+
+    if problem.isBlocksDomain() and linearBlocksPlanner:
+        from blocks_htn import linear
+
+        return linear.find_plan(state_0, state_g)
+
+    if anytimeTimeLimit is not None:
+        return gtpyhop.find_plan_anytime(
+            state_0,
+            [("achieve", state_g)],
+            cost=getPlanCostFunction(problem),
+            time_limit=anytimeTimeLimit,
+            max_nodes=searchMaxNodes,
+            max_memory=searchMaxMemory,
+        )
 
-    def __extractPredicates(self, lines: list[str], start: str, end: str) -> list[Atom]:
-        atoms = []
-        index = 0
-        while lines[index].strip() != start:
-            index += 1
+    result = gtpyhop.find_plan(
+        state_0,
+        [("achieve", state_g)],
+        time_limit=searchTimeLimit,
+        max_nodes=searchMaxNodes,
+        max_memory=searchMaxMemory,
+    )
+    if verbosity > 0:
+        print(f"INFO: search stats: {gtpyhop.search_stats}")
+    return result
+
+
+def planProblems(domain: str, domainFile: str, problemFiles, processes=None):
+    """
+    Plans for each of problemFiles and yields a (problemFile, result, stats)
+    tuple for each one, in the order of problemFiles, where stats is
+    gtpyhop.search_stats for the search (None for the linear blocks
+    planner). Unlike calling runPlanner on each problem, the domain is
+    declared and its dispatch table compiled once, or once per worker when
+    processes is more than 1, in which case the problems are planned in a
+    pool of that many worker processes. Method statistics (see
+    methodStatisticsFile) are only learned when the problems are planned in
+    turn.
+    """
+    jobs = ((domain, domainFile, problemFile) for problemFile in problemFiles)
+    if processes is None or processes <= 1:
+        yield from map(planBatchProblem, jobs)
+        if methodStatistics is not None:
+            methodStatistics.save()
+        return
 
-        index += 1
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(planBatchProblem, jobs)
 
-        while lines[index].strip() != end:
-            line = lines[index]
-            predicate = (
-                line.replace("(", "")
-                .replace(")", "")
-                .replace("=", "")
-                .strip()
-                .split(" ")
-            )
-            atoms.append(Atom(predicate))
-            index += 1
 
-        return atoms
+def planBatchProblem(job: tuple) -> tuple:
+    global batchDomain
+
+    (domain, domainFile, problemFile) = job
+    problem = Problem(domain, domainFile, problemFile)
+    if batchDomain != problem.domain:
+        initializeForDomain(problem)
+        batchDomain = problem.domain
 
+    gtpyhop.search_stats = None
+    result = planProblem(problem)
+    return (problemFile, result, gtpyhop.search_stats)
 
-def runPlanner(problem: Problem) -> None:
-    initializeForDomain(problem)
-    state_0 = generateInitialState(problem)
-    state_g = generateGoalState(problem)
-    return gtpyhop.find_plan(state_0, [("achieve", state_g)])
+
+def getPlanCostFunction(problem: Problem):
+    if problem.isSatelliteDomain():
+        return satelliteFuelUsed
+    return gtpyhop.plan_length
+
+
+def satelliteFuelUsed(state: gtpyhop.State, plan: list[tuple]) -> float:
+    return state.fuel_used
 
 
 def initializeForDomain(problem: Problem) -> None:
+    global batchDomain
+
+    batchDomain = None
     gtpyhop.current_domain = gtpyhop.Domain(problem.domain)
 
     if problem.isBlocksDomain():
@@ -146,24 +282,53 @@ def initializeForDomain(problem: Problem) -> None:
             methods.m_calibrate_instrument_3,
         )
 
+    if methodStatisticsFile is not None:
+        declareLearnedMethodOrdering()
+
+
+def declareLearnedMethodOrdering() -> None:
+    global methodStatistics
+
+    methodStatistics = gtpyhop.MethodStatistics(methodStatisticsFile)
+    for taskName, taskMethods in gtpyhop.current_domain._task_method_dict.items():
+        if len(taskMethods) > 1:
+            gtpyhop.declare_task_method_ordering(taskName, methodStatistics)
+
+
+def initializeForProblem(
+    problem: Problem, state: gtpyhop.State, goal: gtpyhop.Multigoal
+) -> None:
+    if problem.isSatelliteDomain():
+        from satellites_htn import methods
+
+        methods.build_indexes(state)
+        methods.build_agenda(state, goal)
+    elif problem.isBlocksDomain():
+        from blocks_htn import methods
+
+        methods.build_done(state, goal)
+
 
 def generateGoalState(problem: Problem) -> gtpyhop.Multigoal:
     state = gtpyhop.Multigoal("state_g")
-    return generateState(problem, problem.goalAtoms, state)
+    return generateState(problem, problem.goalAtoms, state, problem.goalMatrices)
 
 
 def generateInitialState(problem: Problem) -> gtpyhop.State:
     state = gtpyhop.State("state_0")
-    return generateState(problem, problem.initialAtoms, state)
+    return generateState(
+        problem, problem.initialAtoms, state, problem.initialMatrices
+    )
 
 
 def generateState(
     problem: Problem,
-    atoms: (set[Atom] | list[Atom]),
+    atoms: list[Atom],
     state: (gtpyhop.State | gtpyhop.Multigoal),
+    matrices: dict | None = None,
 ) -> (gtpyhop.State | gtpyhop.Multigoal):
     if problem.isSatelliteDomain():
-        return generateSatelliteState(atoms, state)
+        return generateSatelliteState(atoms, state, matrices)
     elif problem.isBlocksDomain():
         return generateBlocksState(atoms, state)
 
@@ -171,7 +336,9 @@ def generateState(
 
 
 def generateSatelliteState(
-    atoms: (set[Atom] | list[Atom]), state: (gtpyhop.State | gtpyhop.Multigoal)
+    atoms: list[Atom],
+    state: (gtpyhop.State | gtpyhop.Multigoal),
+    matrices: dict | None = None,
 ) -> gtpyhop.State:
     state.cal_target = {}
     state.calibrated = {}
@@ -191,65 +358,87 @@ def generateSatelliteState(
     state.satellite = {}
     state.slew_time = {}
     state.supports = {}
+    state.active_instrument = {}
+    state.outstanding_images = {}
+    state.changed_sats = set()
 
-    for atom in atoms:
-        predicate: list[str] = atom.predicate
-        predName = predicate[0]
+    setters = getSatelliteSetters(state)
+    for predicate in atoms:
+        setter = setters.get(predicate[0])
+        if setter is not None:
+            setter(predicate)
+
+    # slew_time and data never change, so the states share the views of a
+    # compiled problem's matrices instead of copying them
+    for name, values in (matrices or {}).items():
+        if name in (SatelliteFunctions.DATA.value, SatelliteFunctions.SLEW_TIME.value):
+            setattr(state, name, values)
 
-        # check for predicates
-        if predName == SatellitePredicate.CALIBRATED.value:
-            state.calibrated[predicate[1]] = True
-        elif predName == SatellitePredicate.CALIBRATION_TARGET.value:
-            state.cal_target[predicate[1]] = predicate[2]
-        elif predName == SatellitePredicate.DIRECTION.value:
-            state.direction[predicate[1]] = True
-        elif predName == SatellitePredicate.HAVE_IMAGE.value:
-            state.have_image[predicate[1]] = predicate[2]
-        elif predName == SatellitePredicate.INSTRUMENT.value:
-            state.instrument[predicate[1]] = True
-        elif predName == SatellitePredicate.MODE.value:
-            state.mode[predicate[1]] = True
-        elif predName == SatellitePredicate.ON_BOARD.value:
-            state.on_board[predicate[1]] = predicate[2]
-        elif predName == SatellitePredicate.POINTING.value:
-            state.pointing[predicate[1]] = predicate[2]
-        elif predName == SatellitePredicate.POWER_AVAIL.value:
-            state.power_avail[predicate[1]] = True
-        elif predName == SatellitePredicate.POWER_ON.value:
-            state.power_on[predicate[1]] = True
-        elif predName == SatellitePredicate.SATELLITE.value:
-            state.satellite[predicate[1]] = True
-        elif predName == SatellitePredicate.SUPPORTS.value:
-            state.supports[predicate[1]] = predicate[2]
-
-        # check for functions
-        elif predName == SatelliteFunctions.DATA.value:
-            state.data[(predicate[1], predicate[2])] = float(predicate[3])
-        elif predName == SatelliteFunctions.DATA_CAPACITY.value:
-            state.data_capacity[predicate[1]] = float(predicate[2])
-        elif predName == SatelliteFunctions.DATA_STORED.value:
-            state.data_stored = float(predicate[1])
-        elif predName == SatelliteFunctions.FUEL.value:
-            state.fuel[predicate[1]] = float(predicate[2])
-        elif predName == SatelliteFunctions.FUEL_USED.value:
-            state.fuel_used = float(predicate[1])
-        elif predName == SatelliteFunctions.SLEW_TIME.value:
-            state.slew_time[(predicate[1], predicate[2])] = float(predicate[3])
+    for ins in state.power_on:
+        state.active_instrument[state.on_board[ins]] = ins
 
     if verbosity > 0:
         state.display()
     return state
 
 
+def getSatelliteSetters(state: (gtpyhop.State | gtpyhop.Multigoal)) -> dict:
+    """
+    Returns a table that maps each satellite predicate and function name to a
+    function that sets the fact of an atom with that name in state, bound to
+    the state's dictionary for it, so that each atom is ingested with one
+    lookup.
+    """
+
+    def flag(values: dict):
+        return lambda predicate: values.__setitem__(predicate[1], True)
+
+    def value(values: dict):
+        return lambda predicate: values.__setitem__(predicate[1], predicate[2])
+
+    def number(values: dict):
+        return lambda predicate: values.__setitem__(predicate[1], float(predicate[2]))
+
+    def pairNumber(values: dict):
+        return lambda predicate: values.__setitem__(
+            (predicate[1], predicate[2]), float(predicate[3])
+        )
+
+    def scalar(name: str):
+        return lambda predicate: setattr(state, name, float(predicate[1]))
+
+    return {
+        # predicates
+        SatellitePredicate.CALIBRATED.value: flag(state.calibrated),
+        SatellitePredicate.CALIBRATION_TARGET.value: value(state.cal_target),
+        SatellitePredicate.DIRECTION.value: flag(state.direction),
+        SatellitePredicate.HAVE_IMAGE.value: value(state.have_image),
+        SatellitePredicate.INSTRUMENT.value: flag(state.instrument),
+        SatellitePredicate.MODE.value: flag(state.mode),
+        SatellitePredicate.ON_BOARD.value: value(state.on_board),
+        SatellitePredicate.POINTING.value: value(state.pointing),
+        SatellitePredicate.POWER_AVAIL.value: flag(state.power_avail),
+        SatellitePredicate.POWER_ON.value: flag(state.power_on),
+        SatellitePredicate.SATELLITE.value: flag(state.satellite),
+        SatellitePredicate.SUPPORTS.value: value(state.supports),
+        # functions
+        SatelliteFunctions.DATA.value: pairNumber(state.data),
+        SatelliteFunctions.DATA_CAPACITY.value: number(state.data_capacity),
+        SatelliteFunctions.DATA_STORED.value: scalar("data_stored"),
+        SatelliteFunctions.FUEL.value: number(state.fuel),
+        SatelliteFunctions.FUEL_USED.value: scalar("fuel_used"),
+        SatelliteFunctions.SLEW_TIME.value: pairNumber(state.slew_time),
+    }
+
+
 def generateBlocksState(
-    atoms: (set[Atom] | list[Atom]), state: (gtpyhop.State | gtpyhop.Multigoal)
+    atoms: list[Atom], state: (gtpyhop.State | gtpyhop.Multigoal)
 ) -> (gtpyhop.State | gtpyhop.Multigoal):
     state.pos = {}
     state.clear = {}
     state.holding = {}
 
-    for atom in atoms:
-        predicate: list[str] = atom.predicate
+    for predicate in atoms:
         predName = predicate[0]
         if predName == BlocksPredicate.CLEAR.value:
             state.clear[predicate[1]] = True
@@ -266,13 +455,62 @@ def generateBlocksState(
 
 
 def main():
-    if len(sys.argv) != 4:
+    global linearBlocksPlanner, anytimeTimeLimit
+    global searchTimeLimit, searchMaxNodes, searchMaxMemory, methodStatisticsFile
+    global parallelWorkers
+    global useCompiledProblems
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    options = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    if len(args) < 3:
         print(f"ERROR: Incorrect number of arguments: {len(sys.argv)}")
         return
 
-    domain = sys.argv[1]
-    domainFile = sys.argv[2]
-    problemFile = sys.argv[3]
+    processes = None
+
+    for option in options:
+        if option == "--linear":
+            linearBlocksPlanner = True
+        elif option.startswith("--anytime="):
+            anytimeTimeLimit = float(option.split("=", 1)[1])
+        elif option.startswith("--time-limit="):
+            searchTimeLimit = float(option.split("=", 1)[1])
+        elif option.startswith("--max-nodes="):
+            searchMaxNodes = int(option.split("=", 1)[1])
+        elif option.startswith("--max-memory="):
+            searchMaxMemory = float(option.split("=", 1)[1])
+        elif option.startswith("--method-stats="):
+            methodStatisticsFile = option.split("=", 1)[1]
+        elif option == "--compiled":
+            useCompiledProblems = True
+        elif option.startswith("--processes="):
+            processes = int(option.split("=", 1)[1])
+        elif option.startswith("--parallel-workers="):
+            parallelWorkers = int(option.split("=", 1)[1])
+        else:
+            print(f"ERROR: Unknown option: {option}")
+            return
+
+    # the batch workers are daemonic processes, which can't start the pools
+    # of the parallel search
+    if len(args) > 3 and processes is not None and processes > 1:
+        if parallelWorkers is not None and parallelWorkers > 1:
+            print("ERROR: --processes and --parallel-workers can't both be more than 1")
+            return
+
+    domain = args[0]
+    domainFile = args[1]
+    if len(args) > 3:
+        # several problems: plan them as a batch, in a pool of workers if
+        # --processes=N is given
+        for problemFile, result, stats in planProblems(
+            domain, domainFile, args[2:], processes
+        ):
+            status = stats.status if stats else ("plan-found" if result else "no-plan")
+            print(f"INFO: {problemFile}: {status}")
+        return
+
+    problemFile = args[2]
     problem = Problem(domain, domainFile, problemFile)
 
     result = runPlanner(problem)
@@ -1,3 +1,12 @@
+"""
+Action definitions for the satellite domain.
+
+Besides the domain's state variables, each action adds the satellite it
+changes to state.changed_sats, so that the methods' CollectionAgenda only
+re-keys the collections of that satellite (see methods.CollectionAgenda).
+"""
+
+
 def fuel_required(state, dir_new, dir_old) -> int:
     return state.slew_time[(dir_old, dir_new)]
 
@@ -18,6 +27,7 @@ def turn_to(state, sat, dir_old, dir_new):
     state.pointing[sat] = dir_new
     state.fuel[sat] -= req_fuel
     state.fuel_used += req_fuel
+    state.changed_sats.add(sat)
     return state
 
 
@@ -28,6 +38,8 @@ def switch_on(state, int, sat):
     state.power_on[int] = True
     state.calibrated[int] = False
     state.power_avail[sat] = False
+    state.active_instrument[sat] = int
+    state.changed_sats.add(sat)
     return state
 
 
@@ -37,6 +49,8 @@ def switch_off(state, int, sat):
 
     state.power_on[int] = False
     state.power_avail[sat] = True
+    state.active_instrument.pop(sat, None)
+    state.changed_sats.add(sat)
     return state
 
 
@@ -50,6 +64,7 @@ def calibrate(state, sat, int, dir):
         return
 
     state.calibrated[int] = True
+    state.changed_sats.add(sat)
     return state
 
 
@@ -68,4 +83,7 @@ def take_image(state, sat, dir, int, mode):
     state.data_capacity[sat] -= req_data
     state.have_image[dir] = mode
     state.data_stored += req_data
+    if state.outstanding_images.get(dir) == mode:
+        del state.outstanding_images[dir]
+    state.changed_sats.add(sat)
     return state
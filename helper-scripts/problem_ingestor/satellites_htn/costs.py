@@ -0,0 +1,119 @@
+"""
+Vectorized cost engine for the satellite methods. The slew-time matrix and
+the rigid instrument facts are laid out as NumPy arrays once per problem, so
+the cost of every (satellite, instrument, target) triple can be computed in
+one batched operation instead of one getFuelCost lookup at a time.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the methods fall back to pure Python
+    np = None
+
+
+class CostEngine:
+    """
+    engine = CostEngine(state) builds the arrays from the initial state of a
+    problem. engine.cheapest(state) then returns the same result as
+    methods.getCheapestCollection for any state reached while planning.
+    """
+
+    def __init__(self, state) -> None:
+        dirs = dict.fromkeys(state.direction)
+        for (dir_from, dir_to) in state.slew_time:
+            dirs.update(dict.fromkeys((dir_from, dir_to)))
+        dirs.update(dict.fromkeys(state.pointing.values()))
+        dirs.update(dict.fromkeys(state.cal_target.values()))
+        dirs.update(dict.fromkeys(dir for (dir, _) in state.data))
+        self.dir_index = {dir: i for i, dir in enumerate(dirs)}
+
+        modes = dict.fromkeys(state.supports.values())
+        modes.update(dict.fromkeys(mode for (_, mode) in state.data))
+        self.mode_index = {mode: i for i, mode in enumerate(modes)}
+
+        self.sats = list(dict.fromkeys(state.on_board.values()))
+        self.sat_index = {sat: i for i, sat in enumerate(self.sats)}
+
+        # instruments are ordered like state.supports, which is the order
+        # methods.getInstrumentsSupportingMode returns them in
+        self.instruments = list(state.supports)
+        self.ins_index = {ins: i for i, ins in enumerate(self.instruments)}
+
+        num_dirs = len(self.dir_index)
+
+        # missing slew times cost nothing, as in methods.getFuelCost
+        self.slew = np.zeros((num_dirs, num_dirs))
+        for (dir_from, dir_to), time in state.slew_time.items():
+            self.slew[self.dir_index[dir_from], self.dir_index[dir_to]] = time
+
+        # images without a data requirement can never be taken
+        self.data = np.full((num_dirs, len(self.mode_index)), np.inf)
+        for (dir, mode), data in state.data.items():
+            self.data[self.dir_index[dir], self.mode_index[mode]] = data
+
+        self.ins_sat = np.array(
+            [self.sat_index[state.on_board[ins]] for ins in self.instruments],
+            dtype=np.intp,
+        )
+        self.ins_mode = np.array(
+            [self.mode_index[state.supports[ins]] for ins in self.instruments],
+            dtype=np.intp,
+        )
+        self.ins_cal = np.array(
+            [self.dir_index[state.cal_target[ins]] for ins in self.instruments],
+            dtype=np.intp,
+        )
+
+    def cheapest(self, state) -> tuple | None:
+        """
+        Returns the (sat, dir, ins, mode, status) tuple for the outstanding
+        image that is currently cheapest to collect, or None if no outstanding
+        image can be collected. The costs of all image-instrument pairs form a
+        (targets, instruments) matrix and the best pair is picked with argmin,
+        which breaks ties by agenda order, then by instrument order.
+        """
+        targets = list(state.outstanding_images.items())
+        if not targets or not self.instruments:
+            return None
+
+        t_dir = np.array([self.dir_index[dir] for (dir, _) in targets], dtype=np.intp)
+        t_mode = np.array(
+            [self.mode_index.get(mode, -1) for (_, mode) in targets], dtype=np.intp
+        )
+
+        pointing = np.array(
+            [self.dir_index[state.pointing[sat]] for sat in self.sats], dtype=np.intp
+        )
+        fuel = np.array([state.fuel[sat] for sat in self.sats])
+        capacity = np.array([state.data_capacity[sat] for sat in self.sats])
+
+        ready = np.zeros(len(self.instruments), dtype=bool)
+        for ins in state.active_instrument.values():
+            if state.calibrated.get(ins):
+                ready[self.ins_index[ins]] = True
+
+        cur_dir = pointing[self.ins_sat]
+        direct = self.slew[cur_dir[None, :], t_dir[:, None]]
+        detour = (
+            self.slew[cur_dir, self.ins_cal][None, :]
+            + self.slew[self.ins_cal[None, :], t_dir[:, None]]
+        )
+        cost = np.where(ready[None, :], direct, detour)
+
+        has_fuel = (fuel[self.ins_sat][None, :] >= direct) | (
+            cur_dir[None, :] == t_dir[:, None]
+        )
+        has_data = capacity[self.ins_sat][None, :] >= self.data[t_dir, t_mode][:, None]
+        supports = (self.ins_mode[None, :] == t_mode[:, None]) & (t_mode[:, None] >= 0)
+
+        cost = np.where(supports & has_fuel & has_data, cost, np.inf)
+        best = int(np.argmin(cost))
+        (t, i) = divmod(best, len(self.instruments))
+        if not np.isfinite(cost[t, i]):
+            return None
+
+        (dir, mode) = targets[t]
+        ins = self.instruments[i]
+        sat = state.on_board[ins]
+        status = "collect-target" if ready[i] else "calibrate-instrument"
+        return (sat, dir, ins, mode, status)
@@ -1,3 +1,154 @@
+import heapq
+
+from . import costs
+
+################################################################################
+# Static indexes over the rigid facts of a problem. Instruments, the modes
+# they support, and the satellites they are on board never change while
+# planning, so these are built once per problem by build_indexes instead of
+# being rescanned on every method call. (Calibration targets need no index:
+# state.cal_target is already keyed by instrument.)
+
+instruments_by_mode: dict[str, list[str]] = {}
+instruments_by_sat: dict[str, list[str]] = {}
+# each instrument's position in state.supports, and each desired image's
+# position in the goal, which break ties between equally cheap collections
+instrument_order: dict[str, int] = {}
+agenda_order: dict[str, int] = {}
+
+# getCheapestCollection uses the state's CollectionAgenda, which only
+# re-keys the collections of the satellites that actions changed since the
+# last call. Set use_cost_engine to True (before build_indexes) to use the
+# vectorized cost engine instead, when NumPy is available, which recomputes
+# the cost of every outstanding collection on each call.
+use_cost_engine = False
+cost_engine: costs.CostEngine | None = None
+
+
+def build_indexes(state) -> None:
+    """
+    Builds the mode->instruments and satellite->instruments indexes and, if
+    use_cost_engine, the cost engine from the initial state. Must be called
+    once per problem before planning.
+    """
+    global cost_engine
+
+    instruments_by_mode.clear()
+    instruments_by_sat.clear()
+    instrument_order.clear()
+
+    for ins, mode in state.supports.items():
+        instruments_by_mode.setdefault(mode, []).append(ins)
+        instrument_order[ins] = len(instrument_order)
+
+    for ins, sat in state.on_board.items():
+        instruments_by_sat.setdefault(sat, []).append(ins)
+
+    if use_cost_engine and costs.np is not None:
+        cost_engine = costs.CostEngine(state)
+    else:
+        cost_engine = None
+
+
+def build_agenda(state, goal) -> None:
+    """
+    Fills state.outstanding_images with the desired images of the goal that
+    the state does not have yet, and gives the state a CollectionAgenda of
+    them. take_image removes images from the agenda as they are collected,
+    so m_collect_all never revisits achieved images.
+    """
+    agenda_order.clear()
+    agenda_order.update((dir, i) for i, dir in enumerate(goal.have_image))
+
+    state.outstanding_images = {
+        dir: mode
+        for dir, mode in goal.have_image.items()
+        if state.have_image.get(dir) != mode
+    }
+    state.collection_agenda = CollectionAgenda()
+    state.changed_sats = set(instruments_by_sat)
+
+
+class CollectionAgenda:
+    """
+    The ways to collect the outstanding images, as a heap of
+    (cost, agenda order, instrument order, dir, ins, sat, version) entries,
+    so the cheapest collection is found without recomputing the cost of
+    every image for every instrument (see getCollectionCost).
+
+    The cost and status of collecting an image with an instrument only
+    depend on the instrument's satellite, whose pointing, fuel, data
+    capacity, and instruments' power and calibration only change by actions
+    of that satellite. Each action adds its satellite to state.changed_sats;
+    update then re-keys that satellite's entries, by pushing new ones with
+    the satellite's next version. Entries of older versions and of collected
+    images are dropped lazily, when they reach the top of the heap, or when
+    they outnumber the current ones and the heap is rebuilt without them.
+    """
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.versions = {}
+        self.sizes = {}
+
+    def __deepcopy__(self, memo):
+        # the entries are immutable tuples, so copying the containers is enough
+        agenda = CollectionAgenda.__new__(CollectionAgenda)
+        agenda.heap = list(self.heap)
+        agenda.versions = dict(self.versions)
+        agenda.sizes = dict(self.sizes)
+        return agenda
+
+    def update(self, state) -> None:
+        """Re-keys the entries of the satellites in state.changed_sats."""
+        for sat in state.changed_sats:
+            version = self.versions.get(sat, -1) + 1
+            self.versions[sat] = version
+            entries = [
+                (
+                    getCollectionCost(state, sat, ins, dir),
+                    agenda_order[dir],
+                    instrument_order[ins],
+                    dir,
+                    ins,
+                    sat,
+                    version,
+                )
+                for dir, mode in state.outstanding_images.items()
+                for ins in instruments_by_sat.get(sat, [])
+                if state.supports[ins] == mode
+            ]
+            self.sizes[sat] = len(entries)
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+        state.changed_sats.clear()
+
+        if len(self.heap) > 2 * sum(self.sizes.values()) + 64:
+            self.heap = [entry for entry in self.heap if self.isCurrent(state, entry)]
+            heapq.heapify(self.heap)
+
+    def isCurrent(self, state, entry: tuple) -> bool:
+        (_, _, _, dir, _, sat, version) = entry
+        return version == self.versions[sat] and dir in state.outstanding_images
+
+    def cheapest(self, state) -> tuple | None:
+        """Same as getCheapestCollection, for the agenda of state."""
+        self.update(state)
+        heap = self.heap
+        while heap:
+            entry = heap[0]
+            if self.isCurrent(state, entry):
+                (_, _, _, dir, ins, sat, _) = entry
+                mode = state.outstanding_images[dir]
+                status = getStatus(state, sat, dir, ins, mode)
+                if status != "insufficient-resources":
+                    return (sat, dir, ins, mode, status)
+            # stale, or can't be collected until its satellite changes, when
+            # it's re-keyed
+            heapq.heappop(heap)
+        return None
+
+
 ################################################################################
 # Helper functions that are used in the methods' preconditions.
 
@@ -27,22 +178,15 @@ def satHasSufficientData(state, sat, dir, mode):
     return state.data_capacity[sat] >= req_data
 
 
-def getInstrumentsSupportingMode(state, mode: str) -> set[str]:
-    return [ins for ins in state.supports if state.supports[ins] == mode]
-
+def getInstrumentsSupportingMode(state, mode: str) -> list[str]:
+    return instruments_by_mode.get(mode, [])
 
-def getSatsSupportingInstruments(state, supporting_instruments: set[str]) -> set[str]:
-    return {state.on_board[x] for x in supporting_instruments}
 
-
-def getActiveInstrumentForSat(state, sat) -> list[str]:
-    active_int = [int for int in state.power_on if state.on_board[int] == sat]
-    return active_int[0] if any(active_int) else None
+def getActiveInstrumentForSat(state, sat) -> str | None:
+    return state.active_instrument.get(sat)
 
 
 def getStatus(state, sat, dir, ins, mode):
-    cal_dir = state.cal_target[ins]
-
     if instrumentReadyToCollect(state, ins) and satHasResources(state, sat, dir, mode):
         return "collect-target"
     elif satHasResources(state, sat, dir, mode):
@@ -51,31 +195,34 @@ def getStatus(state, sat, dir, ins, mode):
         return "insufficient-resources"
 
 
-def sortSatInsByCost(state, sats: set[str], ints: set[str], dir: str) -> list[tuple]:
+def getCollectionCost(state, sat, ins, dir) -> float:
     """
-    Returns a sorted list of satellite-instrument pairs to point to the provided direction.
-    The list is sorted in ascending order by the total fuel cost. If an instrument is
-    calibrated and powered on, the cost is the fuel to slew to the desired direction.
-    Otherwise, the cost is the fuel to slew from the current direction to the calibration
-    target plus the fuel to slew from the calibration target to the desired direction.
+    Returns the fuel cost for the satellite-instrument pair to collect an image
+    of the provided direction. If the instrument is calibrated and powered on,
+    the cost is the fuel to slew to the desired direction. Otherwise, the cost
+    is the fuel to slew from the current direction to the calibration target
+    plus the fuel to slew from the calibration target to the desired direction.
     """
+    cur_dir = state.pointing[sat]
+    if instrumentReadyToCollect(state, ins):
+        return getFuelCost(state, cur_dir, dir)
 
-    costs = {}
+    cal_dir = state.cal_target[ins]
+    return getFuelCost(state, cur_dir, cal_dir) + getFuelCost(state, cal_dir, dir)
 
-    for sat in sats:
-        cur_dir = state.pointing[sat]
-        sat_ints = [int for int in ints if state.on_board[int] == sat]
-        for sat_int in sat_ints:
-            if state.calibrated.get(sat_int) and state.power_on.get(sat_int):
-                cost = getFuelCost(state, cur_dir, dir)
-            else:
-                cal_dir = state.cal_target[sat_int]
-                cost = getFuelCost(state, cur_dir, cal_dir) + getFuelCost(
-                    state, cal_dir, dir
-                )
-            costs[(sat, sat_int)] = cost
 
-    return [sat for (sat, _) in sorted(costs.items(), key=lambda x: x[1])]
+def getCheapestCollection(state) -> tuple | None:
+    """
+    Returns the (sat, dir, ins, mode, status) tuple for the outstanding image
+    that is currently cheapest to collect, considering every instrument that
+    supports the image's mode and has the resources to collect it. Ties are
+    broken by agenda order, then by instrument order. Returns None if no
+    outstanding image can be collected.
+    """
+    if use_cost_engine and cost_engine is not None:
+        return cost_engine.cheapest(state)
+
+    return state.collection_agenda.cheapest(state)
 
 
 ################################################################################
@@ -84,36 +231,27 @@ def sortSatInsByCost(state, sats: set[str], ints: set[str], dir: str) -> list[tu
 
 def m_collect_all(state, goal):
     """
-    Method to collect all desired images.
+    Method to collect all desired images. Only the images still on the
+    state's agenda (see build_agenda) are considered, and the one that is
+    currently cheapest to collect is worked on first.
     """
 
-    desired_images: dict = goal.have_image
+    cheapest = getCheapestCollection(state)
+    if cheapest is None:
+        return []
 
-    for dir, mode in desired_images.items():
-        if state.have_image.get(dir) == mode:
-            continue
+    (sat, dir, ins, mode, status) = cheapest
 
-        supporting_ins = getInstrumentsSupportingMode(state, mode)
-        supporting_sats = getSatsSupportingInstruments(state, supporting_ins)
-        sat_ins_cost_sorted = sortSatInsByCost(
-            state, supporting_sats, supporting_ins, dir
-        )
-
-        for (sat, ins) in sat_ins_cost_sorted:
-            status = getStatus(state, sat, dir, ins, mode)
-
-            if status == "collect-target":
-                return [
-                    ("collect", sat, dir, ins, mode),
-                    ("achieve", goal),
-                ]
-            elif status == "calibrate-instrument":
-                return [
-                    ("calibrate_instrument", sat, ins),
-                    ("achieve", goal),
-                ]
-
-    return []
+    if status == "collect-target":
+        return [
+            ("collect", sat, dir, ins, mode),
+            ("achieve", goal),
+        ]
+    else:
+        return [
+            ("calibrate_instrument", sat, ins),
+            ("achieve", goal),
+        ]
 
 
 def m_collect_1(state, sat, dir, ins, mode) -> list[tuple] | bool:
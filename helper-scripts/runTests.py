@@ -4,6 +4,7 @@ import multiprocessing
 import os, re, time
 import sys
 import statistics
+import tempfile
 from threading import Thread
 from multiprocessing import Queue, Pool
 from subprocess import Popen, PIPE
@@ -11,34 +12,137 @@ from enum import Enum
 from astropy.time import Time
 from datetime import datetime
 
+# problem_generators lives with the HTN planner in problem_ingestor
+sys.path.append(f"{os.environ['PROJ_DIR']}/helper-scripts/problem_ingestor")
+import problem_generators
+
 PROJ_DIR = os.environ["PROJ_DIR"]
 BENCHMARKS_DIR = os.environ["BENCHMARKS_DIR"]
 HTN_PLAN_FOUND = "INFO: plan found"
 USE_MULTITHREADING = True
 POOL_SIZE = 20
 TIMEOUT = 30
+# The HTN planner stops its own search a little before TIMEOUT so that it can
+# still report how far it got instead of being killed.
+HTN_TIME_LIMIT = TIMEOUT - 5
+# If greater than 1, the HTN planner explores the alternatives of its choice
+# points in this many worker processes, so that hard problems can use the
+# cores that the POOL_SIZE problem workers leave idle.
+HTN_PARALLEL_WORKERS = 0
 VERBOSITY = 0
+# Generated problems are handed to the planners without being written to
+# BENCHMARKS_DIR: the HTN planner reads them from stdin, and Metric-FF, which
+# only reads files, from a temporary file in HANDOFF_DIR (RAM-backed where
+# /dev/shm exists), which is removed when it's done. They are only kept, in
+# BENCHMARKS_DIR, when PERSIST_PROBLEMS is set or a planner fails on them.
+PERSIST_PROBLEMS = False
+HANDOFF_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
 
 global DOMAIN
 
 
+class PlannerOutput:
+    """
+    Parses a planner's output a line at a time, as the planner writes it,
+    keeping only the last match of each of the patterns and whether the
+    output mentions an error, so that the output, which can be tens of MB
+    with tracing turned on, is never held in memory.
+    """
+
+    patterns: dict[str, re.Pattern] = {}
+
+    def __init__(self) -> None:
+        self.error = False
+        self.matches = dict.fromkeys(self.patterns)
+
+    def feed(self, line: str) -> None:
+        if "error" in line:
+            self.error = True
+        for name, pattern in self.patterns.items():
+            found = pattern.findall(line)
+            if found:
+                self.matches[name] = found[-1]
+
+
+class HtnPlannerOutput(PlannerOutput):
+    patterns = {
+        "runTime": re.compile(r"FP> runtime = (\d+.\d+)"),
+        "result": re.compile(r"FP> result = (\[\(.*\)\])"),
+        "numNodesExpanded": re.compile(r"depth (\d+) todo_list"),
+        # the planner's own count, which is all that modes without a search
+        # trace (e.g., --linear) report
+        "nodesExpanded": re.compile(r"FP> nodes expanded = (\d+)"),
+    }
+    statusPattern = re.compile(r"FP> status = (\S+)")
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.planFound = False
+        self.status = None
+
+    def feed(self, line: str) -> None:
+        super().feed(line)
+        if HTN_PLAN_FOUND in line:
+            self.planFound = True
+        if self.status is None:
+            match = self.statusPattern.search(line)
+            if match:
+                self.status = match.group(1)
+
+
+class DomainIndPlannerOutput(PlannerOutput):
+    # a line starts with the whitespace that the patterns of the whole
+    # output matched at the end of the previous line
+    patterns = {
+        "runTime": re.compile(r"(?:^|\s)(\d+.\d+) seconds total time"),
+        "numSteps": re.compile(r"(?:^|\s)(\d+):\s"),
+        "numNodesExpanded": re.compile(r"evaluating (\d+) states"),
+    }
+
+
 class RunCmd(Thread):
     cmdArr: list[str]
     runDir: str
     timeout: int
-
-    def __init__(self, cmdArr: list[str], runDir: str, timeout: int, stdoutOpt=PIPE):
+    output: PlannerOutput
+
+    def __init__(
+        self,
+        cmdArr: list[str],
+        runDir: str,
+        timeout: int,
+        output: PlannerOutput,
+        stdinData: str | None = None,
+    ):
         Thread.__init__(self)
         self.cmdArr = cmdArr
         self.runDir = runDir
         self.timeout = timeout
-        self.stdoutOpt = stdoutOpt
+        self.output = output
+        self.stdinData = stdinData
 
     def run(self):
-        self.p = Popen(self.cmdArr, stdout=self.stdoutOpt)
+        if self.stdinData is None:
+            self.p = Popen(self.cmdArr, stdout=PIPE, text=True)
+        else:
+            self.p = Popen(self.cmdArr, stdin=PIPE, stdout=PIPE, text=True)
+            # written by another thread, so that the process can't block
+            # writing its output while this one blocks writing its input
+            Thread(target=self.writeInput, daemon=True).start()
+
+        for line in self.p.stdout:
+            self.output.feed(line)
         self.p.wait()
 
-    def Run(self) -> str | bool:
+    def writeInput(self):
+        try:
+            self.p.stdin.write(self.stdinData)
+            self.p.stdin.close()
+        except BrokenPipeError:
+            # the process exited without reading all of its input
+            pass
+
+    def Run(self) -> PlannerOutput | bool:
         retVal = False
         oldDir = os.getcwd()
 
@@ -49,10 +153,8 @@ class RunCmd(Thread):
         if self.is_alive():
             self.p.terminate()
             self.join()
-        elif self.stdoutOpt == PIPE:
-            retVal = self.p.communicate()[0].decode()
-            if "error" in retVal:
-                retVal = False
+        elif not self.output.error:
+            retVal = self.output
 
         os.chdir(oldDir)
         return retVal
@@ -74,7 +176,7 @@ class PlanData:
     runTime: float
     numSteps: int
     numNodesExpanded: int
-    data: str
+    output: PlannerOutput
 
     def display(self) -> None:
         print("----- Plan Details -----")
@@ -90,14 +192,16 @@ class PlanData:
         except:
             if VERBOSITY > 0:
                 printError(
-                    f"Exception in func {parseFunc.__name__} parsing {self.type.value} Plan {self.problemSize}.{self.successCount} : {self.data}"
+                    f"Exception in func {parseFunc.__name__} parsing {self.type.value} Plan {self.problemSize}.{self.successCount} : {self.output.matches}"
                 )
             return None
 
 
 class HtnPlanData(PlanData):
-    def __init__(self, data: str, probSize: int, successCount: int) -> None:
-        self.data = data
+    def __init__(
+        self, output: HtnPlannerOutput, probSize: int, successCount: int
+    ) -> None:
+        self.output = output
         self.type = PlanType.HTN
         self.problemSize = probSize
         self.successCount = successCount
@@ -106,12 +210,10 @@ class HtnPlanData(PlanData):
         self.numNodesExpanded = super().tryParse(self.__extractNumNodesExpanded)
 
     def __extractRunTime(self) -> str:
-        runTimeRegex = "FP> runtime = (\d+.\d+)"
-        return re.findall(runTimeRegex, self.data, re.M)[-1]
+        return self.output.matches["runTime"]
 
     def __extractNumSteps(self) -> str:
-        numStepsRegex = "FP> result = (\[\(.*\)\])"
-        result = re.findall(numStepsRegex, self.data, re.M)[-1]
+        result = self.output.matches["result"]
 
         # get ready for some hacky business
         numLParens = result.count("(")
@@ -125,13 +227,16 @@ class HtnPlanData(PlanData):
             exit()
 
     def __extractNumNodesExpanded(self) -> str:
-        numStepsExpandedRegex = "depth (\d+) todo_list"
-        return re.findall(numStepsExpandedRegex, self.data, re.M)[-1]
+        if self.output.matches["numNodesExpanded"] is None:
+            return self.output.matches["nodesExpanded"]
+        return self.output.matches["numNodesExpanded"]
 
 
 class DomainIndPlanData(PlanData):
-    def __init__(self, data: str, probSize: int, successCount: int) -> None:
-        self.data = data
+    def __init__(
+        self, output: DomainIndPlannerOutput, probSize: int, successCount: int
+    ) -> None:
+        self.output = output
         self.type = PlanType.DOM_IND
         self.problemSize = probSize
         self.successCount = successCount
@@ -140,16 +245,13 @@ class DomainIndPlanData(PlanData):
         self.numNodesExpanded = super().tryParse(self.__extractNumNodesExpanded)
 
     def __extractRunTime(self) -> str:
-        runTimeRegex = "\s+(\d+.\d+) seconds total time"
-        return re.findall(runTimeRegex, self.data, re.M)[-1]
+        return self.output.matches["runTime"]
 
     def __extractNumSteps(self) -> str:
-        numStepsRegex = "\s+(\d+):\s"
-        return re.findall(numStepsRegex, self.data, re.M)[-1]
+        return self.output.matches["numSteps"]
 
     def __extractNumNodesExpanded(self) -> str:
-        numStepsExpandedRegex = "evaluating (\d+) states"
-        return str(int(re.findall(numStepsExpandedRegex, self.data, re.M)[-1]) + 1)
+        return str(int(self.output.matches["numNodesExpanded"]) + 1)
 
 
 def getRandSeed() -> int:
@@ -171,93 +273,97 @@ def printError(msg: str) -> None:
     print(f"{datetime.utcnow().isoformat()} - ERROR: {msg}")
 
 
-def generateProblemFile(probSize: int, domain: DomainType, successCount: int) -> str:
+def generateProblem(
+    probSize: int, domain: DomainType, successCount: int
+) -> tuple[str, str]:
+    """Returns the file name and the PDDL of a new problem."""
     if domain == DomainType.SATELLITE:
-        return generateSatelliteProblemFile(probSize, successCount)
+        return generateSatelliteProblem(probSize, successCount)
     elif domain == DomainType.BLOCKS:
-        return generateBlocksProblemFile(probSize, successCount)
+        return generateBlocksProblem(probSize, successCount)
     else:
         printError("Unknown domain")
         exit()
 
 
-def generateSatelliteProblemFile(numTargets: int, successCount: int) -> str:
+def generateSatelliteProblem(numTargets: int, successCount: int) -> tuple[str, str]:
     randseed = getRandSeed()
     numSats = 10
     numMaxIntsPerSat = 5
     numModes = 5
     numObs = 5
 
-    subProcessArr = [
-        "./satgen",
-        "-c",
-        "-n",
-        "-u",
-        str(randseed),
-        str(numSats),
-        str(numMaxIntsPerSat),
-        str(numModes),
-        str(numTargets),
-        str(numObs),
-    ]
-
-    fileName = f"test.{numTargets}.{successCount}.pddl"
-
-    with open(fileName, "w") as f:
-        RunCmd(
-            subProcessArr, f"{PROJ_DIR}/satellite-generator", TIMEOUT, stdoutOpt=f
-        ).Run()
-
-    os.replace(
-        f"{PROJ_DIR}/helper-scripts/{fileName}",
-        f"{BENCHMARKS_DIR}/satellite/{fileName}",
+    # the same problem as satgen -c -n -u, generated without a subprocess
+    problem = problem_generators.generateSatelliteProblem(
+        randseed, numSats, numMaxIntsPerSat, numModes, numTargets, numObs
     )
 
-    return fileName
+    fileName = f"test.{numTargets}.{successCount}.pddl"
+    return (fileName, problem.toPddl())
 
 
-def generateBlocksProblemFile(numBlocks: int, successCount: int) -> str:
+def generateBlocksProblem(numBlocks: int, successCount: int) -> tuple[str, str]:
     randseed = getRandSeed()
 
+    # the same problem as bwstates followed by generate-prob-pddl.py,
+    # generated without subprocesses or the intermediate file
     fileName = f"test.{numBlocks}.{successCount}"
-    subProcessArr = ["./bwstates", "-r", str(randseed), "-n", str(numBlocks)]
-    with open(fileName, "w") as f:
-        RunCmd(subProcessArr, f"{PROJ_DIR}/bwstates-src", TIMEOUT, stdoutOpt=f).Run()
-
-    os.replace(
-        f"{PROJ_DIR}/helper-scripts/{fileName}",
-        f"{BENCHMARKS_DIR}/blocks/{fileName}",
-    )
+    problem = problem_generators.generateBlocksProblem(randseed, numBlocks, fileName)
+    return (f"{fileName}.pddl", problem.toPddl())
 
-    subProcessArr = ["./generate-prob-pddl.py", f"{BENCHMARKS_DIR}/blocks/{fileName}"]
-    RunCmd(subProcessArr, f"{PROJ_DIR}/helper-scripts", TIMEOUT).Run()
 
-    return f"{fileName}.pddl"
+def persistProblem(fileName: str, pddl: str, domain: DomainType) -> None:
+    with open(f"{BENCHMARKS_DIR}/{domain.value}/{fileName}", "w") as f:
+        f.write(pddl)
 
 
-def runHtnPlanner(fileName: str, domain: DomainType) -> str:
+def runHtnPlanner(pddl: str, domain: DomainType) -> HtnPlannerOutput | bool:
     subProcessArr = [
         "./problem_ingestor.py",
         domain.value,
         f"{BENCHMARKS_DIR}/{domain.value}/domain.pddl",
-        f"{BENCHMARKS_DIR}/{domain.value}/{fileName}",
+        "-",
+        f"--time-limit={HTN_TIME_LIMIT}",
+        f"--parallel-workers={HTN_PARALLEL_WORKERS}",
     ]
 
     return RunCmd(
-        subProcessArr, f"{PROJ_DIR}/helper-scripts/problem_ingestor", TIMEOUT
+        subProcessArr,
+        f"{PROJ_DIR}/helper-scripts/problem_ingestor",
+        TIMEOUT,
+        HtnPlannerOutput(),
+        stdinData=pddl,
     ).Run()
 
 
-def runDomIndPlanner(fileName: str, domain: DomainType) -> str:
-    subProcessArr = [
-        "./ff",
-        "-o",
-        f"{BENCHMARKS_DIR}/{domain.value}/domain.pddl",
-        "-f",
-        f"{BENCHMARKS_DIR}/{domain.value}/{fileName}",
-    ]
-
-    return RunCmd(subProcessArr, f"{PROJ_DIR}/metric-ff", TIMEOUT).Run()
+def getHtnSearchStatus(htnResult: HtnPlannerOutput | bool) -> str:
+    if not htnResult:
+        return "killed or errored"
+    if htnResult.status is None:
+        return "unknown status"
+    return htnResult.status
+
+
+def runDomIndPlanner(
+    fileName: str, pddl: str, domain: DomainType
+) -> DomainIndPlannerOutput | bool:
+    with tempfile.NamedTemporaryFile(
+        "w", suffix=f"-{fileName}", dir=HANDOFF_DIR
+    ) as problemFile:
+        problemFile.write(pddl)
+        problemFile.flush()
+
+        subProcessArr = [
+            "./ff",
+            "-o",
+            f"{BENCHMARKS_DIR}/{domain.value}/domain.pddl",
+            "-f",
+            problemFile.name,
+        ]
+
+        return RunCmd(
+            subProcessArr, f"{PROJ_DIR}/metric-ff", TIMEOUT, DomainIndPlannerOutput()
+        ).Run()
 
 
 def generatePlanData(
@@ -266,12 +372,16 @@ def generatePlanData(
     success = False
 
     while not success:
-        fileName = generateProblemFile(probSize, domain, successCount)
-        htnResult = runHtnPlanner(fileName, domain)
-        domIndResult = runDomIndPlanner(fileName, domain)
-        if not htnResult or htnResult.find(HTN_PLAN_FOUND) < 0:
+        (fileName, pddl) = generateProblem(probSize, domain, successCount)
+        htnResult = runHtnPlanner(pddl, domain)
+        domIndResult = runDomIndPlanner(fileName, pddl, domain)
+        htnFailed = not htnResult or not htnResult.planFound
+        if PERSIST_PROBLEMS or htnFailed or not domIndResult:
+            persistProblem(fileName, pddl, domain)
+
+        if htnFailed:
             printWarn(
-                f"Failed to find HTN solution for plan {successCount} problem size {probSize}, retrying..."
+                f"Failed to find HTN solution for plan {successCount} problem size {probSize} ({getHtnSearchStatus(htnResult)}), retrying..."
             )
         elif not domIndResult:
             printWarn(